@@ -0,0 +1,5 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    name: "BatchExtractor.processPool" for name in ("extract_many", "TaskTimeout", "WorkerCrashed", "worker_context")
+})
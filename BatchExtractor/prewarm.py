@@ -0,0 +1,6 @@
+# Imported by the forkserver before it forks any worker (see
+# processPool.worker_context), so every worker starts with the handlers of
+# every format loaded and the spelling index open
+import main
+
+main.prewarm()
@@ -0,0 +1,336 @@
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import time
+
+# Documents are split in chunks of this many pages, so a huge file is spread
+# over every worker instead of pinning one of them for its whole length
+PAGES_PER_TASK = 8
+TASK_TIMEOUT = 300
+# Documents being split per worker; new documents are only read from the input
+# once there is room, which keeps memory bounded for arbitrarily long inputs
+DOCUMENTS_PER_WORKER = 2
+# Per worker, documents are kept open between tasks
+MAX_OPEN_DOCUMENTS = 8
+
+_open_documents = OrderedDict()
+_caches = {}
+
+
+def worker_context(prewarm=True):
+    # Workers are forked from a forkserver, a clean process that never ran a
+    # thread or an event loop. With prewarm the forkserver loads the pipelines
+    # and models once, and every worker forked from it (including the ones that
+    # replace a crashed pool) starts ready instead of importing them again.
+    # A process has a single forkserver and the preload only counts until it
+    # has started
+    context = multiprocessing.get_context("forkserver")
+    if prewarm:
+        context.set_forkserver_preload(["BatchExtractor.prewarm"])
+    return context
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def _get_document(file_path):
+    import fitz
+
+    doc = _open_documents.pop(file_path, None)
+    if doc is None:
+        doc = fitz.open(file_path, filetype='pdf')
+    _open_documents[file_path] = doc
+    while len(_open_documents) > MAX_OPEN_DOCUMENTS:
+        _, oldest = _open_documents.popitem(last=False)
+        oldest.close()
+    return doc
+
+
+def _get_cache(cache_path):
+    import ExtractionCache
+
+    if cache_path is None:
+        return None
+    if cache_path not in _caches:
+        _caches[cache_path] = ExtractionCache.ExtractionCache(cache_path)
+    return _caches[cache_path]
+
+
+def run_task(file_path, pages, classification, cache_path=None):
+    # Runs inside the worker process. The pipelines are imported here so they
+    # and their models are loaded once per worker and then reused
+    import DocumentPipeline
+    import main
+
+    cache = _get_cache(cache_path)
+    if pages is None:
+        texts = list(main.iter_extract(file_path, cache=cache))
+    else:
+        texts = list(DocumentPipeline.iter_pdf(_get_document(file_path), pages, classification, cache=cache))
+    _flush_cache(cache)
+    return texts
+
+
+def run_batch(items, cache_path=None, progress_path=None):
+    # Runs inside the worker process. items are (file path, page number,
+    # classification) and pdf pages of every document in the batch are
+    # extracted together; a None page number stands for a whole document in
+    # any other format. Returns the list of text blocks of each item.
+    # Items finish in order, and with progress_path the text blocks of each
+    # one are appended to it as a json line as soon as it is done, so whoever
+    # kills a stuck batch keeps what it got through
+    import DocumentPipeline
+
+    cache = _get_cache(cache_path)
+    pages = [(_get_document(path), page, classification) for path, page, classification in items if page is not None]
+    texts = iter(DocumentPipeline.extract_page_batch(pages, cache=cache))
+    results = []
+    for path, page, _ in items:
+        results.append(run_task(path, None, None, cache_path) if page is None else [next(texts)])
+        if progress_path is not None:
+            with open(progress_path, "a") as progress:
+                progress.write(json.dumps(results[-1]) + "\n")
+    _flush_cache(cache)
+    return results
+
+
+def plan_document(file_path):
+    # Runs inside the worker process. Opening and classifying a pdf is the one
+    # step that touches MuPDF before the pages are split, so it happens here
+    # where a file that crashes it only takes a worker down. The document is
+    # kept open for the page tasks that land on the same worker
+    import Dispatcher
+
+    file_type = Dispatcher.sniff_file_type(file_path)
+    if file_type != 'pdf':
+        return file_type, 1, None
+    doc = _get_document(file_path)
+    return file_type, doc.page_count, Dispatcher.classify_pdf(doc)
+
+
+def _flush_cache(cache):
+    # The cache batches its shared hit and miss counters, and workers are
+    # killed rather than closed, so they are written back after every task
+    if cache is not None:
+        cache.flush()
+
+
+class _Document:
+    def __init__(self, path):
+        self.path = path
+        self.chunks = {}
+        self.pending = 0
+        self.planned = False
+        self.error = None
+
+    def is_done(self):
+        return self.error is not None or (self.planned and self.pending == 0)
+
+    def text(self):
+        return "".join(text for index in sorted(self.chunks) for text in self.chunks[index])
+
+
+class _Task:
+    # A task without an index plans its document (plan_document) instead of
+    # extracting it
+    def __init__(self, document, index, pages, classification):
+        self.document = document
+        self.index = index
+        self.pages = pages
+        self.classification = classification
+        self.isolated = False
+        self.deadline = None
+
+    def submit(self, pool, cache_path):
+        if self.index is None:
+            return pool.submit(plan_document, self.document.path)
+        return pool.submit(run_task, self.document.path, self.pages, self.classification, cache_path)
+
+    def describe(self):
+        if self.index is None:
+            return f"{self.document.path} (planning)"
+        return f"{self.document.path}" + (f" pages {self.pages}" if self.pages is not None else "")
+
+
+def plan_tasks(document):
+    # Only the file type is sniffed here, pdfs are opened and classified by a
+    # worker and split in page tasks once that comes back (page_tasks)
+    import Dispatcher
+
+    if Dispatcher.sniff_file_type(document.path) != 'pdf':
+        yield _Task(document, 0, None, None)
+    else:
+        yield _Task(document, None, None, None)
+
+
+def page_tasks(document, page_count, classification, pages_per_task):
+    for index, start in enumerate(range(0, max(page_count, 1), pages_per_task)):
+        yield _Task(document, index, range(start, min(start + pages_per_task, page_count)), classification)
+
+
+def extract_many(paths, workers=None, pages_per_task=PAGES_PER_TASK, task_timeout=TASK_TIMEOUT, cache_path=None,
+                 prewarm=False):
+    # Yields (path, text, error) for each document as soon as all of its pages
+    # are done. Pages always come back in order within a document, while
+    # documents are reported in completion order so a huge file never holds
+    # back the small ones queued after it. error is None on success.
+    # Workers share the extraction cache at cache_path when one is given.
+    # With prewarm they are forked ready from a forkserver (worker_context),
+    # which pays off for many documents, not for a couple of files
+    workers = workers or os.cpu_count() or 1
+    max_active = workers * DOCUMENTS_PER_WORKER
+    paths = iter(paths)
+    paths_exhausted = False
+
+    # Documents that still have tasks to submit, served round robin
+    active = deque()
+    # Tasks lost when the pool was replaced, through no fault of their own
+    retries = deque()
+    # Tasks that were running when a worker died. Any of them may be the
+    # culprit, so each one is rerun alone to find out which
+    suspects = deque()
+    in_flight = {}
+    documents = []
+    mp_context = worker_context() if prewarm else None
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+
+    def next_task():
+        while retries:
+            task = retries.popleft()
+            if task.document.error is None:
+                return task
+        while active:
+            document, tasks = active.popleft()
+            if document.error is not None:
+                continue
+            try:
+                task = next(tasks)
+            except StopIteration:
+                document.planned = True
+                continue
+            except Exception as error:
+                document.error = error
+                continue
+            document.pending += 1
+            # A planning task comes back with the page tasks of its document
+            if task.index is not None:
+                active.append((document, tasks))
+            return task
+        return None
+
+    try:
+        while True:
+            # Documents being planned by a worker are not in active but still
+            # count, or the whole input would be read while they are out
+            planning = sum(1 for task in in_flight.values() if task.index is None)
+            while not paths_exhausted and len(active) + planning < max_active:
+                try:
+                    path = next(paths)
+                except StopIteration:
+                    paths_exhausted = True
+                    break
+                document = _Document(path)
+                documents.append(document)
+                active.append((document, plan_tasks(document)))
+
+            # A task is only submitted when a worker is free to start it, so its
+            # timeout never counts time spent waiting in the pool's queue
+            while len(in_flight) < workers:
+                if any(task.isolated for task in in_flight.values()):
+                    break
+                if suspects:
+                    if in_flight:
+                        break
+                    task = suspects.popleft()
+                    if task.document.error is not None:
+                        continue
+                    task.isolated = True
+                else:
+                    task = next_task()
+                    if task is None:
+                        break
+                task.deadline = time.monotonic() + task_timeout
+                try:
+                    future = task.submit(pool, cache_path)
+                except BrokenProcessPool:
+                    # A worker died since the last check, the task never ran
+                    # and goes back in front until the pool is replaced below
+                    (suspects if task.isolated else retries).appendleft(task)
+                    break
+                in_flight[future] = task
+
+            for document in [document for document in documents if document.is_done()]:
+                documents.remove(document)
+                if document.error is None:
+                    yield document.path, document.text(), None
+                else:
+                    yield document.path, None, document.error
+
+            if not in_flight:
+                if paths_exhausted and not active and not retries and not suspects:
+                    break
+                continue
+
+            timeout = max(min(task.deadline for task in in_flight.values()) - time.monotonic(), 0)
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            pool_broken = False
+            for future in done:
+                task = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    task.document.pending -= 1
+                    if task.index is None:
+                        _, page_count, classification = result
+                        active.append((task.document, page_tasks(task.document, page_count, classification,
+                                                                 pages_per_task)))
+                    else:
+                        task.document.chunks[task.index] = result
+                except BrokenProcessPool:
+                    pool_broken = True
+                    if task.isolated:
+                        task.document.pending -= 1
+                        task.document.error = WorkerCrashed(f"Worker died while extracting {task.describe()}")
+                    else:
+                        suspects.append(task)
+                except Exception as error:
+                    task.document.pending -= 1
+                    task.document.error = error
+
+            now = time.monotonic()
+            expired = [future for future, task in in_flight.items() if task.deadline <= now]
+            if not expired and not pool_broken:
+                continue
+
+            # A task that hangs or kills its worker takes the whole pool down with
+            # it, so the pool is replaced and everything else that was running is
+            # submitted again
+            for future in expired:
+                task = in_flight.pop(future)
+                task.document.pending -= 1
+                task.document.error = TaskTimeout(f"Extraction of {task.describe()} timed out")
+            for task in in_flight.values():
+                (suspects if pool_broken else retries).append(task)
+            in_flight.clear()
+            _terminate(pool)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    finally:
+        _terminate(pool)
+
+
+def _terminate(pool):
+    # ProcessPoolExecutor has no way to stop a running task, the processes
+    # have to be killed directly
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
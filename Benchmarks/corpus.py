@@ -0,0 +1,120 @@
+from PIL import Image
+import zipfile
+import io
+import random
+import fitz
+import json
+import os
+
+from SyntheticDocumentGenerator.fastGenerator import generate_page
+
+WORDS = (
+    "the layout of a document page holds titles paragraphs tables and footers which the extractor "
+    "has to read in order while skipping watermarks page numbers and other boilerplate text"
+).split()
+DOCX_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DOCX_NAMESPACES = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in [
+    ("w", DOCX_NAMESPACE),
+    ("mc", "http://schemas.openxmlformats.org/markup-compatibility/2006"),
+    ("wp", "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"),
+    ("a", "http://schemas.openxmlformats.org/drawingml/2006/main"),
+    ("wps", "http://schemas.microsoft.com/office/word/2010/wordprocessingShape"),
+    ("v", "urn:schemas-microsoft-com:vml"),
+])
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+
+def sentences(rng, count):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "." for _ in range(count)]
+
+
+def write_digital_pdf(path, rng, pages):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(72, 60, 540, 100), sentences(rng, 1)[0], fontsize=18)
+        page.insert_textbox(fitz.Rect(72, 110, 540, 760), " ".join(sentences(rng, 30)), fontsize=10)
+    doc.save(path)
+
+
+def write_scanned_pdf(path, rng, pages):
+    # Pages from the synthetic generator, embedded as images with no text layer
+    doc = fitz.open()
+    for _ in range(pages):
+        image, _ = generate_page(rng)
+        page = doc.new_page(width=image.shape[1] * 72 / 150, height=image.shape[0] * 72 / 150)
+        page_image = Image.fromarray(image)
+        page.insert_image(page.rect, stream=image_bytes(page_image))
+    doc.save(path)
+
+
+def image_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def docx_text_box(text):
+    # A text box the way Word saves it: DrawingML for current readers and the
+    # same content again as VML for old ones, inside the paragraph it is
+    # anchored to
+    content = f"<w:txbxContent><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:txbxContent>"
+    return ("<w:p><w:r><mc:AlternateContent>"
+            f'<mc:Choice Requires="wps"><w:drawing><wp:anchor><a:graphic><a:graphicData><wps:wsp><wps:txbx>{content}'
+            "</wps:txbx></wps:wsp></a:graphicData></a:graphic></wp:anchor></w:drawing></mc:Choice>"
+            f"<mc:Fallback><w:pict><v:shape><v:textbox>{content}</v:textbox></v:shape></w:pict></mc:Fallback>"
+            "</mc:AlternateContent></w:r></w:p>")
+
+
+def write_docx(path, rng, paragraphs):
+    texts = sentences(rng, paragraphs)
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in texts[1:])
+    body = f"<w:p><w:r><w:t>{texts[0]}</w:t></w:r></w:p>" + docx_text_box(sentences(rng, 1)[0]) + body
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("word/document.xml", f'<w:document {DOCX_NAMESPACES}><w:body>{body}</w:body></w:document>')
+
+
+def write_html(path, rng, paragraphs):
+    body = "".join(f"<p>{text}</p>" for text in sentences(rng, paragraphs))
+    with open(path, "w") as html_file:
+        html_file.write(f"<!DOCTYPE html><html><head><title>Benchmark</title><script>var x = 1;</script></head>"
+                        f"<body><h1>{sentences(rng, 1)[0]}</h1>{body}</body></html>")
+
+
+def write_txt(path, rng, paragraphs):
+    with open(path, "w") as text_file:
+        text_file.write("\n".join(sentences(rng, paragraphs)))
+
+
+def build_corpus(output_path, seed=0, documents=4, pages=8):
+    # Writes `documents` files of every kind and a manifest. The same seed
+    # always produces the same corpus, so runs on different machines or
+    # commits measure the same work
+    os.makedirs(output_path, exist_ok=True)
+    writers = [
+        ("digital", "pdf", write_digital_pdf, pages),
+        ("scanned", "pdf", write_scanned_pdf, pages),
+        ("docx", "docx", write_docx, pages * 30),
+        ("html", "html", write_html, pages * 30),
+        ("txt", "txt", write_txt, pages * 30),
+    ]
+    files = []
+    for kind, extension, writer, size in writers:
+        for index in range(documents):
+            rng = random.Random(f"{seed}-{kind}-{index}")
+            path = os.path.join(output_path, f"{kind}-{index}.{extension}")
+            writer(path, rng, size)
+            files.append({"path": os.path.basename(path), "kind": kind})
+
+    manifest = {"seed": seed, "documents": documents, "pages": pages, "files": files}
+    with open(os.path.join(output_path, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
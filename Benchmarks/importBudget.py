@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# A fresh interpreter has this long to import main and extract a small text
+# file, interpreter startup not included
+DEFAULT_BUDGET_MS = 50
+DEFAULT_RUNS = 5
+# None of these may be imported to extract a text file, they belong to the pdf
+# and OCR formats only
+HEAVY_MODULES = ["fitz", "numpy", "PIL", "pytesseract", "sqlite3", "zipfile", "concurrent.futures", "multiprocessing"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+main.extract_text(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "modules": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def measure(file_path, runs=DEFAULT_RUNS):
+    # Every run is a new interpreter, so nothing is cached in sys.modules
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", CHILD, file_path, *HEAVY_MODULES],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {
+        "file": file_path,
+        "runs": runs,
+        "median_ms": round(statistics.median(sample["ms"] for sample in samples), 2),
+        "max_ms": round(max(sample["ms"] for sample in samples), 2),
+        "heavy_modules": sorted({name for sample in samples for name in sample["modules"]}),
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Check how long a fresh process takes to extract a text file")
+    parser.add_argument("--file", help="file to extract, a small generated txt file by default")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = args.file
+        if file_path is None:
+            file_path = os.path.join(directory, "sample.txt")
+            with open(file_path, "w", encoding="utf-8") as text_file:
+                text_file.write("A short plain text document.\n" * 100)
+        result = measure(os.path.abspath(file_path), args.runs)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    if result["median_ms"] > args.budget_ms:
+        failures.append(f"median {result['median_ms']} ms is over the {args.budget_ms} ms budget")
+    if result["heavy_modules"]:
+        failures.append(f"imported {', '.join(result['heavy_modules'])}")
+    for failure in failures:
+        print(f"OVER BUDGET {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
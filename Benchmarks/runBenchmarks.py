@@ -0,0 +1,303 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import multiprocessing
+import platform
+import random
+import resource
+import shutil
+import string
+import tempfile
+import time
+import fitz
+import json
+import sys
+import os
+
+import numpy as np
+
+import Dispatcher
+import ExtractionCache
+import LayoutClassifier
+import OCRPipeline
+import PostProcessing
+import TextPipeline
+import main
+from Benchmarks.corpus import build_corpus
+from PostProcessing.symSpell import WORD_PATTERN
+
+RESULTS_VERSION = 1
+# A stage regresses when its throughput drops, or its p95 latency grows, by
+# more than this fraction of the baseline
+DEFAULT_TOLERANCE = 0.1
+
+
+class StageTimer:
+    def __init__(self):
+        self.latencies = []
+        self.units = 0
+
+    def measure(self, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.record(time.perf_counter() - start)
+        return result
+
+    def record(self, seconds, units=1):
+        self.latencies.append(seconds)
+        self.units += units
+
+    def summary(self):
+        if not self.latencies:
+            return {"units": 0, "skipped": True}
+        latencies = np.asarray(self.latencies) * 1000
+        total = latencies.sum() / 1000
+        return {
+            "units": self.units,
+            "seconds": round(float(total), 4),
+            "units_per_sec": round(self.units / total, 2) if total else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def peak_rss_mb():
+    # ru_maxrss is the peak of the whole process so far, which is why every
+    # stage runs in a process of its own. It is in KB on Linux and in bytes on
+    # macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def bench_dispatch(paths):
+    timer = StageTimer()
+
+    def dispatch(path):
+        if Dispatcher.sniff_file_type(path) == "pdf":
+            with fitz.open(path) as doc:
+                Dispatcher.classify_pdf(doc)
+
+    for path in paths:
+        timer.measure(dispatch, path)
+    return timer.summary()
+
+
+def bench_text(paths):
+    # One unit per page, or per block for formats without pages
+    timer = StageTimer()
+    for path in paths:
+        file_type = Dispatcher.sniff_file_type(path)
+        if file_type == "pdf":
+            with fitz.open(path) as doc:
+                if Dispatcher.classify_pdf(doc)[0] != "digital":
+                    continue
+                for page in doc:
+                    timer.measure(TextPipeline.extract_page_text, page)
+        else:
+            blocks = main.iter_extract(path)
+            while True:
+                start = time.perf_counter()
+                block = next(blocks, None)
+                if block is None:
+                    break
+                timer.record(time.perf_counter() - start)
+    return timer.summary()
+
+
+def bench_layout(paths):
+    timer = StageTimer()
+    for path in paths:
+        with fitz.open(path) as doc:
+            for page in doc:
+                pix, array = OCRPipeline.render_page(page)
+                timer.measure(OCRPipeline.propose_page_regions, array)
+                del pix, array
+    return timer.summary()
+
+
+def bench_orientation(paths, batch_size=16):
+    # One unit per page, detected in batches like the OCR pipeline does
+    timer = StageTimer()
+    for path in paths:
+        with fitz.open(path) as doc:
+            pages = list(doc)
+            for start in range(0, len(pages), batch_size):
+                batch = pages[start:start + batch_size]
+                began = time.perf_counter()
+                LayoutClassifier.page_rotations(batch)
+                timer.record(time.perf_counter() - began, len(batch))
+    return timer.summary()
+
+
+def bench_ocr(paths):
+    timer = StageTimer()
+    if not shutil.which("tesseract"):
+        return {"units": 0, "skipped": True, "reason": "tesseract not found"}
+    for path in paths:
+        with fitz.open(path) as doc:
+            for page in doc:
+                timer.measure(OCRPipeline.ocr_page, page)
+    return timer.summary()
+
+
+def bench_postprocess(paths, vocabulary=50000, typo_rate=0.05, seed=0):
+    # One unit per word. The dictionary is built from the words of the text
+    # documents, padded with made up words to a realistic size, and the text
+    # is the same documents with a typo in one word out of twenty
+    rng = random.Random(seed)
+    text_paths = [path for path in paths if Dispatcher.sniff_file_type(path) == "txt"]
+    counts = PostProcessing.count_words(text_paths)
+    while len(counts) < vocabulary:
+        counts["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))] += 1
+
+    def typo(match):
+        word = match.group()
+        if rng.random() >= typo_rate:
+            return word
+        index = rng.randrange(len(word))
+        return word[:index] + rng.choice(string.ascii_lowercase) + word[index + 1:]
+
+    index_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        index = PostProcessing.SymSpellIndex(PostProcessing.build_index(counts, os.path.join(index_dir, "words.symspell")))
+        build_seconds = time.perf_counter() - start
+        timer = StageTimer()
+        for path in text_paths:
+            with open(path, encoding="utf-8") as text_file:
+                for line in text_file:
+                    line = WORD_PATTERN.sub(typo, line)
+                    start = time.perf_counter()
+                    index.correct_text(PostProcessing.clean_text(line, index.__contains__))
+                    timer.record(time.perf_counter() - start, len(line.split()))
+        del index
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return {**timer.summary(), "index_words": len(counts), "index_build_seconds": round(build_seconds, 3)}
+
+
+def bench_end_to_end(paths):
+    # Every document extracted twice through a fresh cache, cold then warm
+    cold, warm = StageTimer(), StageTimer()
+    cache_dir = tempfile.mkdtemp()
+    cache = ExtractionCache.ExtractionCache(os.path.join(cache_dir, "cache.sqlite"))
+    try:
+        for timer in (cold, warm):
+            for path in paths:
+                timer.measure(main.extract_text, path, cache)
+        stats = cache.stats()
+    finally:
+        cache.close()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "cold": cold.summary(),
+        "warm": warm.summary(),
+        "cache": {"hits": stats["hits"], "misses": stats["misses"],
+                  "hit_rate": round(stats["hits"] / lookups, 4) if lookups else None},
+    }
+
+
+STAGES = {
+    "dispatch": lambda corpus: bench_dispatch(corpus["all"]),
+    "text": lambda corpus: bench_text(corpus["text"]),
+    "layout": lambda corpus: bench_layout(corpus["scanned"]),
+    "orientation": lambda corpus: bench_orientation(corpus["scanned"]),
+    "ocr": lambda corpus: bench_ocr(corpus["scanned"]),
+    "postprocess": lambda corpus: bench_postprocess(corpus["text"]),
+}
+
+
+def run_stage(name, paths):
+    if name == "end_to_end":
+        # Scanned documents can only be extracted with tesseract installed
+        return bench_end_to_end(paths["all"] if shutil.which("tesseract") else paths["text"])
+    return STAGES[name](paths)
+
+
+def run_benchmarks(corpus_path, stages=None):
+    with open(os.path.join(corpus_path, "manifest.json")) as manifest_file:
+        manifest = json.load(manifest_file)
+    paths = {"all": [], "text": [], "scanned": []}
+    for entry in manifest["files"]:
+        path = os.path.join(corpus_path, entry["path"])
+        paths["all"].append(path)
+        paths["scanned" if entry["kind"] == "scanned" else "text"].append(path)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "corpus": {key: manifest[key] for key in ("seed", "documents", "pages")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "stages": {},
+    }
+    # A fresh interpreter per stage, so its peak RSS is its own and not the
+    # largest of the stages before it. A forked child would inherit the peak
+    context = multiprocessing.get_context("spawn")
+    for name in [*STAGES, "end_to_end"]:
+        if stages is None or name in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                summary = pool.submit(run_stage, name, paths).result()
+            if name == "end_to_end":
+                results["end_to_end"] = summary
+            else:
+                results["stages"][name] = summary
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns a description of every stage that got slower than the baseline
+    regressions = []
+    current = dict(results["stages"])
+    previous = dict(baseline["stages"])
+    for phase in ("cold", "warm"):
+        if phase in results.get("end_to_end", {}) and phase in baseline.get("end_to_end", {}):
+            current[f"end_to_end.{phase}"] = results["end_to_end"][phase]
+            previous[f"end_to_end.{phase}"] = baseline["end_to_end"][phase]
+
+    for name, summary in current.items():
+        reference = previous.get(name)
+        # Stages skipped or without timings on either side (OCR without
+        # tesseract, an older baseline) cannot be compared
+        if not reference or summary.get("units_per_sec") is None or reference.get("units_per_sec") is None:
+            continue
+        if summary["units_per_sec"] < reference["units_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {summary['units_per_sec']} units/sec, baseline {reference['units_per_sec']}")
+        if summary["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {summary['p95_ms']} ms, baseline {reference['p95_ms']}")
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline stages on a generated corpus")
+    parser.add_argument("--corpus", default="data/benchmark", help="corpus directory, built if missing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--documents", type=int, default=4, help="documents of each kind")
+    parser.add_argument("--pages", type=int, default=8, help="pages per pdf")
+    parser.add_argument("--stages", nargs="*", help=f"subset of {list(STAGES) + ['end_to_end']}")
+    parser.add_argument("--output", help="where to write the results json")
+    parser.add_argument("--baseline", help="results json to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.corpus, "manifest.json")):
+        build_corpus(args.corpus, args.seed, args.documents, args.pages)
+
+    results = run_benchmarks(args.corpus, args.stages)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,3 @@
+from Dispatcher.fileSniffer import sniff_file_type, sniff_bytes, IMAGE_TYPES
+from Dispatcher.pdfClassifier import classify_page, classify_pdf, sample_pages
+from Dispatcher.registry import register_handler, supported_types, load_handler, run_handler, prewarm, lazy_exports
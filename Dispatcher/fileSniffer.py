@@ -0,0 +1,97 @@
+# Only the head of the file is read; every signature we care about lives there
+SNIFF_SIZE = 8192
+
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+# "BM" alone is too weak, plenty of text files start with it. A bitmap also has
+# to declare one of the known DIB header sizes and a file size that fits
+BMP_HEADER_SIZES = {12, 40, 52, 56, 64, 108, 124}
+# Office documents are ZIP containers, told apart by the part that holds their body
+ZIP_MARKERS = [
+    ("word/document.xml", "docx"),
+    ("ppt/presentation.xml", "pptx"),
+    ("xl/workbook.xml", "xlsx"),
+]
+HTML_MARKERS = (b"<!doctype html", b"<html", b"<head", b"<body")
+
+IMAGE_TYPES = {"png", "jpeg", "tiff", "gif", "bmp"}
+
+
+def sniff_file_type(file_path):
+    with open(file_path, "rb") as file:
+        head = file.read(SNIFF_SIZE)
+        file_size = file.seek(0, 2)
+    return sniff_bytes(head, file_path, file_size)
+
+
+def sniff_bytes(head, file_path=None, file_size=None):
+    # The PDF header may be preceded by junk, the spec allows it within the first 1KB
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+
+    for signature, file_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return file_type
+
+    if looks_like_bmp(head, file_size):
+        return "bmp"
+
+    if head.startswith(b"PK\x03\x04"):
+        return sniff_zip(file_path) if file_path else "zip"
+
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if any(marker in text[:1024] for marker in HTML_MARKERS):
+        return "html"
+
+    if looks_like_text(head):
+        return "txt"
+
+    return "unknown"
+
+
+def sniff_zip(file_path):
+    # zipfile only reads the central directory at the end of the archive,
+    # the members themselves are never decompressed here. It is imported here,
+    # it costs more than the rest of the dispatcher and only zips need it
+    import zipfile
+
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            names = set(archive.namelist())
+    except zipfile.BadZipFile:
+        return "unknown"
+
+    for marker, file_type in ZIP_MARKERS:
+        if marker in names:
+            return file_type
+    return "zip"
+
+
+def looks_like_bmp(head, file_size=None):
+    if not head.startswith(b"BM") or len(head) < 18:
+        return False
+    declared_size = int.from_bytes(head[2:6], "little")
+    header_size = int.from_bytes(head[14:18], "little")
+    if header_size not in BMP_HEADER_SIZES:
+        return False
+    # The size field is the whole file, only checked when we know it
+    if file_size is not None:
+        return declared_size == file_size
+    return declared_size >= 14 + header_size
+
+
+def looks_like_text(head):
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as error:
+        # A multi-byte character may be cut at the end of the sniffed block
+        return error.start >= len(head) - 3
+    return True
@@ -0,0 +1,53 @@
+# A page with at least this many characters in its text layer is digital
+MIN_TEXT_CHARS = 16
+# A page without text whose images cover this fraction of it is a scan
+SCANNED_IMAGE_COVERAGE = 0.5
+PDF_SAMPLE_SIZE = 8
+
+
+def classify_page(page):
+    # Uses only the text layer and the placement of the images on the page,
+    # nothing is rendered or decoded
+    text_chars = len(page.get_text("text").strip())
+    if text_chars >= MIN_TEXT_CHARS:
+        return "digital"
+
+    if image_coverage(page) >= SCANNED_IMAGE_COVERAGE:
+        return "scanned"
+    return "digital"
+
+
+def image_coverage(page):
+    page_rect = page.rect
+    page_area = abs(page_rect)
+    if not page_area:
+        return 0.0
+
+    covered = 0.0
+    for image_info in page.get_image_info():
+        image_rect = page_rect & image_info["bbox"]
+        covered += abs(image_rect)
+    return min(covered / page_area, 1.0)
+
+
+def sample_pages(page_count, sample_size=PDF_SAMPLE_SIZE):
+    # Evenly spread over the document, always including the first and last page
+    if page_count <= sample_size:
+        return list(range(page_count))
+    step = (page_count - 1) / (sample_size - 1)
+    return sorted({round(i * step) for i in range(sample_size)})
+
+
+def classify_pdf(doc, sample_size=PDF_SAMPLE_SIZE):
+    # Returns "digital", "scanned" or "mixed" for the document along with the
+    # per page decisions already taken for the sampled pages
+    page_kinds = {}
+    for page_number in sample_pages(doc.page_count, sample_size):
+        page_kinds[page_number] = classify_page(doc.load_page(page_number))
+
+    kinds = set(page_kinds.values())
+    if len(kinds) == 1:
+        return kinds.pop(), page_kinds
+    if not kinds:
+        return "digital", page_kinds
+    return "mixed", page_kinds
@@ -0,0 +1,74 @@
+import importlib
+
+from Dispatcher.fileSniffer import IMAGE_TYPES
+
+# Handlers are named as "module:function" and only imported the first time a
+# file of their type comes in, so a txt file never loads fitz, numpy or PIL.
+# options lists the keyword arguments (pages, cache) a handler takes, preload
+# the modules it imports on first use, which prewarm loads ahead of time
+_handlers = {}
+_loaded = {}
+
+
+def register_handler(file_types, target, options=(), preload=()):
+    for file_type in [file_types] if isinstance(file_types, str) else file_types:
+        _handlers[file_type] = (target, tuple(options), tuple(preload))
+        _loaded.pop(file_type, None)
+
+
+def supported_types():
+    return set(_handlers)
+
+
+def load_handler(file_type):
+    # Returns the handler function of file_type and the options it takes
+    if file_type not in _loaded:
+        target, options, _ = _handlers[file_type]
+        module_name, _, function_name = target.partition(":")
+        _loaded[file_type] = getattr(importlib.import_module(module_name), function_name), options
+    return _loaded[file_type]
+
+
+def run_handler(file_type, file_path, **options):
+    if file_type not in _handlers:
+        raise ValueError(f"Unsupported file type '{file_type}': {file_path}")
+    handler, accepted = load_handler(file_type)
+    return handler(file_path, **{name: value for name, value in options.items() if name in accepted})
+
+
+def prewarm(file_types=None):
+    # Imports the handlers of file_types, every registered one by default,
+    # and the modules they would otherwise load on their first file
+    for file_type in supported_types() if file_types is None else file_types:
+        load_handler(file_type)
+        for module_name in _handlers[file_type][2]:
+            importlib.import_module(module_name)
+
+
+def lazy_exports(package_name, exports):
+    # Module __getattr__ and __dir__ (PEP 562) for a package whose names
+    # ({name: module}) are only imported from their module when first used
+    package = importlib.import_module(package_name)
+
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(exports[name]), name)
+        setattr(package, name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(package)) | set(exports))
+
+    return __getattr__, __dir__
+
+
+OCR_PRELOAD = ("OCRPipeline.regionOcr", "OCRPipeline.imageOcr", "PostProcessing.pipeline", "ExtractionCache.diskCache")
+
+register_handler("pdf", "DocumentPipeline.pdfPipeline:iter_pdf_file", ("pages", "cache"), ("fitz", "TextPipeline.pdfText", "Dispatcher.pdfClassifier", *OCR_PRELOAD))
+register_handler(IMAGE_TYPES, "DocumentPipeline.imagePipeline:iter_image", ("cache",), OCR_PRELOAD)
+register_handler("txt", "TextPipeline.plainText:iter_plain_text")
+register_handler("html", "TextPipeline.htmlText:iter_html_text")
+register_handler("docx", "TextPipeline.officeText:iter_docx_text")
+# One block per slide, shapes in reading order
+register_handler("pptx", "TextPipeline.officeText:iter_pptx_text")
@@ -0,0 +1,7 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    **{name: "DocumentPipeline.cacheKeys" for name in ("cache_key", "PIPELINE_VERSION")},
+    **{name: "DocumentPipeline.pdfPipeline" for name in ("iter_pdf_file", "iter_pdf", "extract_page_batch")},
+    "iter_image": "DocumentPipeline.imagePipeline",
+})
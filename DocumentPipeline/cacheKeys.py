@@ -0,0 +1,19 @@
+import ExtractionCache
+import OCRPipeline
+import PostProcessing
+
+# Part of every cache key, bump it whenever a pipeline change alters the output
+PIPELINE_VERSION = '7'
+
+
+def cache_key(kind, digest):
+    options = {
+        "ocr_dpi": OCRPipeline.RENDER_DPI,
+        "ocr_language": OCRPipeline.OCR_LANGUAGE,
+        "ocr_labels": OCRPipeline.OCR_LABELS,
+        "ocr_text_height": OCRPipeline.TARGET_TEXT_HEIGHT,
+        "layout_downsample": OCRPipeline.LAYOUT_DOWNSAMPLE,
+        "dictionary": PostProcessing.dictionary_id(),
+    }
+    return ExtractionCache.make_key(PIPELINE_VERSION, options, kind, digest)
+
@@ -0,0 +1,26 @@
+import json
+
+import ExtractionCache
+import OCRPipeline
+import PostProcessing
+from DocumentPipeline.cacheKeys import cache_key
+
+
+def iter_image(file_path, cache=None):
+    if cache is None:
+        for text in OCRPipeline.iter_image_ocr(file_path):
+            yield PostProcessing.postprocess_text(text, ocr=True)
+        return
+
+    key = cache_key('image', ExtractionCache.file_digest(file_path))
+    cached = cache.get(key)
+    if cached is not None:
+        yield from json.loads(cached)
+        return
+    frames = []
+    for text in OCRPipeline.iter_image_ocr(file_path):
+        text = PostProcessing.postprocess_text(text, ocr=True)
+        frames.append(text)
+        yield text
+    cache.put(key, json.dumps(frames))
+
@@ -0,0 +1,129 @@
+from collections import deque
+from typing import Iterator, Optional, Sequence
+
+import Dispatcher
+import ExtractionCache
+import OCRPipeline
+import PostProcessing
+import Telemetry
+import TextPipeline
+from DocumentPipeline.cacheKeys import cache_key
+
+# How many pages to walk before asking MuPDF to drop its cached fonts/images,
+# so the resource store does not grow with the size of the document
+STORE_FLUSH_INTERVAL = 32
+# Scanned pages are OCR'd together in groups of this size
+OCR_BATCH_PAGES = 4
+
+
+def iter_pdf_file(file_path, pages=None, cache=None):
+    import fitz
+
+    with fitz.open(file_path, filetype='pdf') as doc:
+        yield from iter_pdf(doc, pages, cache=cache)
+
+
+def iter_pdf(doc, pages: Optional[Sequence[int]] = None, classification=None, cache=None) -> Iterator[str]:
+    # Only a handful of fitz pages (and one pixmap, inside the OCR pipeline) are
+    # alive at a time, so memory stays flat however long the document is.
+    # Callers that split a document in chunks can pass the classification in
+    # so the page sample is only taken once
+    import fitz
+
+    page_numbers = range(doc.page_count) if pages is None else pages
+    # [text, cache key] per page in document order. Scanned pages keep a None
+    # text until their batch has been through OCR
+    results = deque()
+    scanned = []
+    for count, page_number in enumerate(page_numbers, start=1):
+        result, classification = _extract_page(doc, page_number, classification, cache, scanned)
+        results.append(result)
+        if len(scanned) >= OCR_BATCH_PAGES:
+            _ocr_scanned(scanned)
+        if count % STORE_FLUSH_INTERVAL == 0:
+            fitz.TOOLS.store_shrink(100)
+        yield from _ready_pages(results, cache)
+
+    _ocr_scanned(scanned)
+    yield from _ready_pages(results, cache)
+
+
+def extract_page_batch(items, cache=None):
+    # items are (doc, page number, classification) taken from any number of
+    # documents. The scanned pages of all of them go through the OCR engine
+    # together, so many small requests still fill whole strips. Returns the
+    # text of each page in the order of items
+    results = deque()
+    scanned = []
+    for doc, page_number, classification in items:
+        result, _ = _extract_page(doc, page_number, classification, cache, scanned)
+        results.append(result)
+    _ocr_scanned(scanned)
+    return list(_ready_pages(results, cache))
+
+
+def _extract_page(doc, page_number, classification, cache, scanned):
+    # Returns the [text, cache key] of the page and the classification of the
+    # document, which is only computed once a page actually has to be extracted.
+    # Scanned pages are added to scanned with a None text, to be OCR'd in batches
+    with Telemetry.span('page', page=page_number) as page_span:
+        page = doc.load_page(page_number)
+        text = key = None
+        # Pages are cached by their content rather than their position, so
+        # only the pages that changed are extracted again when a document is
+        # edited or reordered
+        if cache is not None:
+            key = cache_key('pdf-page', ExtractionCache.page_digest(doc, page))
+            text = cache.get(key)
+
+        if text is not None:
+            page_span.set(route='cache')
+            Telemetry.count('pages_cached')
+            return [text, None], classification
+
+        if classification is None:
+            with Telemetry.span('classify'):
+                classification = Dispatcher.classify_pdf(doc)
+        doc_kind, page_kinds = classification
+        page_kind = page_kinds.get(page_number)
+        if page_kind is None:
+            page_kind = Dispatcher.classify_page(page) if doc_kind == 'mixed' else doc_kind
+
+        if page_kind == 'digital':
+            with Telemetry.span('text'):
+                text = PostProcessing.postprocess_text(TextPipeline.extract_page_text(page))
+            # Pages outside the sample of a digital document may still be scans
+            if not text.strip() and Dispatcher.classify_page(page) == 'scanned':
+                page_kind = 'scanned'
+        page_span.set(route=page_kind)
+        if page_kind == 'scanned':
+            Telemetry.count('pages_ocr')
+            result = [None, key]
+            scanned.append((page, result))
+        else:
+            Telemetry.count('pages_text')
+            result = [text, key]
+        return result, classification
+
+
+def _ocr_scanned(scanned):
+    if not scanned:
+        return
+    with Telemetry.span('ocr', pages=len(scanned)):
+        texts = OCRPipeline.ocr_pages([page for page, _ in scanned])
+    for (_, result), text in zip(scanned, texts):
+        result[0] = PostProcessing.postprocess_text(text, ocr=True)
+    scanned.clear()
+
+
+def _ready_pages(results, cache):
+    # Hands out the pages at the front of the queue that are done, so pages
+    # always come out in order
+    while results and results[0][0] is not None:
+        text, key = results.popleft()
+        if not text.endswith("\n"):
+            text += "\n"
+        if key is not None:
+            cache.put(key, text)
+        yield text
+
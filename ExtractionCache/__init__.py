@@ -0,0 +1,6 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    name: "ExtractionCache.diskCache"
+    for name in ("ExtractionCache", "make_key", "file_digest", "page_digest", "DEFAULT_CACHE_PATH")
+})
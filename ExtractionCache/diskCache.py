@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+import Telemetry
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "text-extractor", "extraction.sqlite")
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+# Seconds a connection waits on a lock held by another process before giving up
+LOCK_TIMEOUT = 30
+HASH_BLOCK_SIZE = 1 << 20
+# A hit only writes the access time back when the stored one is older than
+# this, eviction does not need finer recency than that
+ACCESS_REFRESH = 60
+# Shared hit and miss counters are written in batches of this many lookups
+COUNTER_FLUSH = 64
+
+
+def make_key(*parts):
+    digest = hashlib.blake2b(digest_size=32)
+    for part in parts:
+        if not isinstance(part, (str, bytes)):
+            part = json.dumps(part, sort_keys=True)
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        # Length prefix so ("ab", "c") and ("a", "bc") never collide
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def file_digest(file_path):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_digest(doc, page):
+    # Hashes what the extracted text depends on: the drawing instructions, the
+    # fonts used to decode them and the raw image streams (for scans), but not
+    # the page position or xref numbers, so a page moved or copied to another
+    # file keeps its key. Pages drawn through Form XObjects (show_pdf_page,
+    # stamped templates) keep their text in the form streams, get_xobjects
+    # lists the forms nested in other forms too
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(repr((tuple(page.rect), page.rotation)).encode())
+    digest.update(page.read_contents())
+    for xref, name, _, bbox in page.get_xobjects():
+        digest.update(repr((name, tuple(bbox))).encode())
+        digest.update(doc.xref_stream(xref) or b"")
+    for font in page.get_fonts():
+        digest.update(repr(font[1:]).encode())
+    for image in page.get_images():
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    # Values are stored compressed in a single sqlite file. WAL mode lets any
+    # number of worker processes read while one of them writes, and every write
+    # runs in its own transaction so the size accounting is never corrupted by
+    # concurrent writers
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = {"hits": 0, "misses": 0}
+        self._pid = None
+        self._connection = None
+
+    @property
+    def connection(self):
+        # sqlite connections must not cross a fork, each process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            connection.execute("INSERT OR IGNORE INTO counters VALUES ('size', 0), ('hits', 0), ('misses', 0)")
+            self._connection = connection
+            self._pending = {"hits": 0, "misses": 0}
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        # Lookups only read, so processes sharing the cache never queue on the
+        # write lock for a hit. Recency and the shared counters are written
+        # back now and then, see ACCESS_REFRESH and COUNTER_FLUSH
+        connection = self.connection
+        row = connection.execute("SELECT value, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            self._pending["misses"] += 1
+            Telemetry.count("cache_misses")
+            if sum(self._pending.values()) >= COUNTER_FLUSH:
+                self.flush()
+            return None
+        self.hits += 1
+        self._pending["hits"] += 1
+        Telemetry.count("cache_hits")
+        now = time.time()
+        if now - row[1] > ACCESS_REFRESH:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self._flush_counters(connection)
+        elif sum(self._pending.values()) >= COUNTER_FLUSH:
+            self.flush()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def flush(self):
+        if not any(self._pending.values()):
+            return
+        with self.connection as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            self._flush_counters(connection)
+
+    def _flush_counters(self, connection):
+        for name, value in self._pending.items():
+            if value:
+                connection.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+        self._pending = {"hits": 0, "misses": 0}
+
+    def put(self, key, text):
+        value = zlib.compress(text.encode("utf-8"))
+        connection = self.connection
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            old = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, value, len(value), time.time()))
+            connection.execute("UPDATE counters SET value = value + ? WHERE name = 'size'", (len(value) - (old[0] if old else 0),))
+            self._flush_counters(connection)
+            self._evict(connection)
+
+    def _evict(self, connection):
+        # Least recently used entries go first until the cache fits again
+        size = connection.execute("SELECT value FROM counters WHERE name = 'size'").fetchone()[0]
+        while size > self.max_size:
+            rows = connection.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, entry_size in rows:
+                if size <= self.max_size:
+                    break
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                size -= entry_size
+        connection.execute("UPDATE counters SET value = ? WHERE name = 'size'", (size,))
+
+    def stats(self):
+        # Counters shared by every process using the cache, alongside the ones
+        # of this process
+        self.flush()
+        counters = dict(self.connection.execute("SELECT name, value FROM counters"))
+        entries = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "size": counters["size"],
+            "max_size": self.max_size,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "process_hits": self.hits,
+            "process_misses": self.misses,
+        }
+
+    def clear(self):
+        with self.connection as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM entries")
+            connection.execute("UPDATE counters SET value = 0")
+        self._pending = {"hits": 0, "misses": 0}
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self.flush()
+            self._connection.close()
+        self._connection = None
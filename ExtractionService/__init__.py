@@ -0,0 +1 @@
+from ExtractionService.server import ExtractionServer, HttpError, serve
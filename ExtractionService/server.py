@@ -0,0 +1,483 @@
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from http import HTTPStatus
+import itertools
+import json
+import os
+import tempfile
+import weakref
+
+from BatchExtractor.processPool import plan_document, run_batch, worker_context, TaskTimeout, WorkerCrashed, _terminate
+import Dispatcher
+import Telemetry
+
+SUPPORTED_TYPES = Dispatcher.supported_types()
+# Pages of requests arriving within this many seconds of each other go to the
+# workers in the same batch, so their OCR regions fill the same strips
+BATCH_WINDOW = 0.02
+BATCH_PAGES = 8
+BATCH_TIMEOUT = 300
+PLAN_TIMEOUT = 60
+# Admission control. Requests are turned away with a 503 rather than queued
+# once this many pages are waiting for a worker or this many requests are open
+MAX_QUEUED_PAGES = 2048
+MAX_REQUESTS = 256
+MAX_BODY_SIZE = 256 * 1024 * 1024
+HEADER_TIMEOUT = 30
+MAX_HEADER_LINES = 100
+READ_CHUNK = 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class _Request:
+    def __init__(self, path, file_type, page_count, classification):
+        self.path = path
+        self.classification = classification
+        # Page numbers still waiting for a worker. Other formats have no pages
+        # and go through as a single None item
+        self.order = list(range(page_count)) if file_type == 'pdf' else [None]
+        self.pending = deque(self.order)
+        # (page, text blocks, error) as the batches finish, in any order
+        self.results = asyncio.Queue()
+        self.outstanding = 0
+        self.closed = False
+
+    def release(self):
+        # The upload is only removed once no batch is reading it anymore
+        if self.closed and self.outstanding == 0:
+            with suppress(FileNotFoundError):
+                os.remove(self.path)
+
+
+def describe(page):
+    return "the document" if page is None else f"page {page}"
+
+
+class ExtractionServer:
+    # POST /extract with the document as the request body streams back one
+    # json line per page as the pages come out of the workers:
+    #   {"page": 0, "text": "..."}
+    #   ...
+    #   {"done": true, "pages": 12}
+    # or a {"error": "...", "type": "..."} line if the extraction fails midway.
+    # Pages of every open request are served round robin, one page per request
+    # per turn, so a large document never holds back the small ones behind it
+    def __init__(self, workers=None, batch_pages=BATCH_PAGES, batch_window=BATCH_WINDOW, batch_timeout=BATCH_TIMEOUT,
+                 plan_timeout=PLAN_TIMEOUT, max_queued_pages=MAX_QUEUED_PAGES, max_requests=MAX_REQUESTS,
+                 max_body_size=MAX_BODY_SIZE, cache_path=None, upload_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_pages = batch_pages
+        self.batch_window = batch_window
+        self.batch_timeout = batch_timeout
+        self.plan_timeout = plan_timeout
+        self.max_queued_pages = max_queued_pages
+        self.max_requests = max_requests
+        self.max_body_size = max_body_size
+        self.cache_path = cache_path
+        self.upload_dir = upload_dir
+        # Requests with pages waiting for a worker, served round robin
+        self.active = deque()
+        # Items a worker had not finished when it died. Any of them may be the
+        # culprit, so each one is run again alone to find out which, on a
+        # single worker pool of its own next to the regular batches
+        self.suspects = deque()
+        self.queued_pages = 0
+        self.open_requests = 0
+        self.in_flight = set()
+        self.counters = {"requests": 0, "rejected": 0, "pages": 0, "batches": 0, "errors": 0}
+        self.pool = None
+        self.isolation_pool = None
+        # Uploads are opened and classified one at a time in a worker process,
+        # where a pdf that crashes or hangs MuPDF only takes that process down
+        self.planner = None
+        self._planning = asyncio.Lock()
+        # Pools killed after a timeout. Batches that break with them did
+        # nothing wrong and go back in the queue instead of under suspicion
+        self._killed = weakref.WeakSet()
+        self.server = None
+        self._scheduler = None
+        self._isolator = None
+        self._work = asyncio.Event()
+        self._suspected = asyncio.Event()
+        # One batch per worker, so a batch starts as soon as it is submitted and
+        # its timeout never counts time spent waiting in the pool's queue
+        self._slots = asyncio.Semaphore(self.workers)
+        self._ids = itertools.count()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self.pool = self._new_pool(self.workers)
+        self.isolation_pool = self._new_pool(1)
+        self.planner = self._new_pool(1)
+        self._scheduler = asyncio.create_task(self._schedule())
+        self._isolator = asyncio.create_task(self._isolate())
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in (self._scheduler, self._isolator):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        for task in list(self.in_flight):
+            task.cancel()
+        for pool in (self.pool, self.isolation_pool, self.planner):
+            if pool is not None:
+                _terminate(pool)
+
+    async def _schedule(self):
+        while True:
+            await self._work.wait()
+            if not self.active:
+                self._work.clear()
+                continue
+
+            await self._slots.acquire()
+            # Gives the pages of requests arriving together a chance to share the batch
+            if self.queued_pages < self.batch_pages and self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            batch = self._take_batch()
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._submit(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    def _take_batch(self):
+        # One page per request in turn, so each request gets its share of the batch
+        batch = []
+        while self.active and len(batch) < self.batch_pages:
+            request = self.active.popleft()
+            if not request.pending:
+                continue
+            batch.append((request, request.pending.popleft()))
+            request.outstanding += 1
+            self.queued_pages -= 1
+            if request.pending:
+                self.active.append(request)
+        return batch
+
+    async def _submit(self, batch):
+        try:
+            await self._run_batch(batch)
+        finally:
+            self._slots.release()
+
+    async def _isolate(self):
+        while True:
+            await self._suspected.wait()
+            if not self.suspects:
+                self._suspected.clear()
+                continue
+            request, page = self.suspects.popleft()
+            if not request.closed:
+                await self._run_batch([(request, page)], isolated=True)
+            else:
+                # Nobody is waiting for the page anymore, but it still counts
+                # against the upload until it is let go
+                request.outstanding -= 1
+                request.release()
+
+    async def _run_batch(self, batch, isolated=False):
+        loop = asyncio.get_running_loop()
+        name = "isolation_pool" if isolated else "pool"
+        pool = getattr(self, name)
+        items = [(request.path, page, request.classification) for request, page in batch]
+        fd, progress_path = tempfile.mkstemp(prefix="batch-", dir=self.upload_dir)
+        os.close(fd)
+        self.counters["batches"] += 1
+        try:
+            results = await asyncio.wait_for(loop.run_in_executor(pool, run_batch, items, self.cache_path, progress_path),
+                                             self.batch_timeout)
+        except (asyncio.TimeoutError, BrokenProcessPool) as error:
+            # A batch that hangs or kills its worker takes the whole pool down
+            # with it. The items it got through are delivered, the ones it was
+            # still on fail if it hung and are suspects if it died
+            timed_out = isinstance(error, asyncio.TimeoutError)
+            killed = pool in self._killed
+            self._replace_pool(name, pool, timed_out)
+            with open(progress_path) as progress:
+                # A line cut short by the kill is not an item done
+                finished = [json.loads(line) for line in progress if line.endswith("\n")]
+            for (request, page), texts in zip(batch, finished):
+                self._deliver(request, page, texts, None)
+            unfinished = batch[len(finished):]
+            if killed:
+                # Broken by the timeout of another batch
+                self._requeue(unfinished)
+            elif timed_out or isolated:
+                for request, page in unfinished:
+                    if timed_out:
+                        failure = TaskTimeout(f"Extraction of {describe(page)} timed out")
+                    else:
+                        failure = WorkerCrashed(f"Worker died while extracting {describe(page)}")
+                    self._deliver(request, page, None, failure)
+            else:
+                self.suspects.extend(unfinished)
+                self._suspected.set()
+        except Exception as error:
+            if len(batch) == 1:
+                self._deliver(*batch[0], None, error)
+                return
+            # One broken document must not fail the requests it was batched with
+            for item in batch:
+                await self._run_batch([item])
+        else:
+            for (request, page), texts in zip(batch, results):
+                self._deliver(request, page, texts, None)
+        finally:
+            os.remove(progress_path)
+
+    async def _plan(self, path):
+        async with self._planning:
+            planner = self.planner
+            try:
+                plan = asyncio.get_running_loop().run_in_executor(planner, plan_document, path)
+                return await asyncio.wait_for(plan, self.plan_timeout)
+            except asyncio.TimeoutError:
+                self._replace_pool("planner", planner)
+                raise TaskTimeout("Opening the document timed out")
+            except BrokenProcessPool:
+                self._replace_pool("planner", planner)
+                raise WorkerCrashed("Worker died while opening the document")
+
+    def _replace_pool(self, name, pool, timed_out=False):
+        if pool is getattr(self, name):
+            if timed_out:
+                self._killed.add(pool)
+            _terminate(pool)
+            setattr(self, name, self._new_pool(self.workers if name == "pool" else 1))
+
+    def _new_pool(self, workers):
+        # Forking a process that already runs an event loop and helper threads
+        # can deadlock the children, so workers come from a forkserver instead,
+        # prewarmed so a replaced pool is serving again right away
+        return ProcessPoolExecutor(max_workers=workers, mp_context=worker_context())
+
+    def _deliver(self, request, page, texts, error):
+        request.outstanding -= 1
+        request.results.put_nowait((page, texts, error))
+        request.release()
+
+    def _requeue(self, batch):
+        # Back to the front of their requests, for the next batches
+        for request, page in reversed(batch):
+            request.outstanding -= 1
+            if request.closed:
+                request.release()
+                continue
+            if not request.pending:
+                self.active.appendleft(request)
+            request.pending.appendleft(page)
+            self.queued_pages += 1
+        if batch:
+            self._work.set()
+
+    def _enqueue(self, request):
+        if request.pending:
+            self.active.append(request)
+            self.queued_pages += len(request.pending)
+            self._work.set()
+
+    def _drop(self, request):
+        request.closed = True
+        self.queued_pages -= len(request.pending)
+        request.pending.clear()
+        request.release()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            method, target, headers = await asyncio.wait_for(read_head(reader), HEADER_TIMEOUT)
+            path = target.split("?", 1)[0]
+            if path == "/extract":
+                if method != "POST":
+                    raise HttpError(405, "Use POST", [("Allow", "POST")])
+                await self._extract(reader, writer, headers)
+            elif path == "/health" and method == "GET":
+                await respond(writer, 200, json.dumps(self.status()))
+            elif path == "/metrics" and method == "GET":
+                await respond(writer, 200, self.prometheus(), "text/plain; version=0.0.4")
+            else:
+                raise HttpError(404, "Not found")
+        except HttpError as error:
+            if error.status == 503:
+                self.counters["rejected"] += 1
+            with suppress(ConnectionError):
+                await respond(writer, error.status, json.dumps({"error": str(error)}), headers=error.headers)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _extract(self, reader, writer, headers):
+        if self.open_requests >= self.max_requests or self.queued_pages >= self.max_queued_pages:
+            raise HttpError(503, "Too many pages queued, try again later", [("Retry-After", "1")])
+        if "content-length" not in headers:
+            raise HttpError(411, "Content-Length is required")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > self.max_body_size:
+            raise HttpError(413, f"Documents are limited to {self.max_body_size} bytes")
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        self.open_requests += 1
+        fd, upload_path = tempfile.mkstemp(prefix=f"request-{next(self._ids)}-", dir=self.upload_dir)
+        request = None
+        try:
+            with os.fdopen(fd, "wb") as file:
+                remaining = length
+                while remaining:
+                    chunk = await reader.read(min(READ_CHUNK, remaining))
+                    if not chunk:
+                        raise ConnectionError("Client went away during the upload")
+                    file.write(chunk)
+                    remaining -= len(chunk)
+
+            try:
+                file_type, page_count, classification = await self._plan(upload_path)
+            except Exception as error:
+                raise HttpError(400, f"Could not read the document: {error}")
+            if file_type not in SUPPORTED_TYPES:
+                raise HttpError(415, f"Unsupported file type '{file_type}'")
+            if self.queued_pages and self.queued_pages + page_count > self.max_queued_pages:
+                raise HttpError(503, "Too many pages queued, try again later", [("Retry-After", "1")])
+
+            request = _Request(upload_path, file_type, page_count, classification)
+            self.counters["requests"] += 1
+            self._enqueue(request)
+            writer.write(response_head(200, "application/x-ndjson", [("Transfer-Encoding", "chunked")]))
+            await self._stream(request, writer)
+        finally:
+            self.open_requests -= 1
+            if request is None:
+                with suppress(FileNotFoundError):
+                    os.remove(upload_path)
+            else:
+                self._drop(request)
+
+    async def _stream(self, request, writer):
+        # Pages are written in order, each one as soon as it and every page
+        # before it are done
+        ready = {}
+        blocks = 0
+        for item in request.order:
+            while item not in ready:
+                page, texts, error = await request.results.get()
+                if error is not None:
+                    self.counters["errors"] += 1
+                    await write_chunk(writer, {"error": str(error), "type": type(error).__name__})
+                    await write_chunk(writer, None)
+                    return
+                ready[page] = texts
+            for text in ready.pop(item):
+                await write_chunk(writer, {"page": blocks, "text": text})
+                blocks += 1
+        self.counters["pages"] += blocks
+        await write_chunk(writer, {"done": True, "pages": blocks})
+        await write_chunk(writer, None)
+
+    def status(self):
+        return {
+            "open_requests": self.open_requests,
+            "queued_pages": self.queued_pages,
+            "batches_in_flight": len(self.in_flight),
+            "workers": self.workers,
+        }
+
+    def prometheus(self):
+        lines = [Telemetry.prometheus_text(self.counters, {}, prefix="text_extractor_service").rstrip("\n")]
+        for name, value in self.status().items():
+            lines.append(f"# TYPE text_extractor_service_{name} gauge")
+            lines.append(f"text_extractor_service_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+async def read_head(reader):
+    try:
+        request_line = await reader.readline()
+        if not request_line:
+            raise ConnectionError("Connection closed before the request")
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return method.upper(), target, headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:
+        raise HttpError(400, "Malformed request")
+    raise HttpError(431, "Too many headers")
+
+
+def response_head(status, content_type, headers=()):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}", "Connection: close"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def respond(writer, status, body, content_type="application/json", headers=()):
+    body = body.encode()
+    writer.write(response_head(status, content_type, [("Content-Length", len(body)), *headers]) + body)
+    await writer.drain()
+
+
+async def write_chunk(writer, line):
+    # One json line per chunk of the chunked response, None ends the response
+    if line is None:
+        writer.write(b"0\r\n\r\n")
+    else:
+        data = json.dumps(line).encode() + b"\n"
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    await writer.drain()
+
+
+async def serve(host="127.0.0.1", port=8080, **options):
+    server = ExtractionServer(**options)
+    await server.start(host, port)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Serve text extraction over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per cpu by default")
+    parser.add_argument("--batch-pages", type=int, default=BATCH_PAGES, help="pages per worker call")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW, help="seconds to wait for a batch to fill")
+    parser.add_argument("--max-queued-pages", type=int, default=MAX_QUEUED_PAGES)
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS)
+    parser.add_argument("--cache", default=None, help="extraction cache path shared by the workers")
+    args = parser.parse_args(argv)
+
+    print(f"Serving on http://{args.host}:{args.port}/extract")
+    with suppress(KeyboardInterrupt):
+        asyncio.run(serve(args.host, args.port, workers=args.workers, batch_pages=args.batch_pages,
+                          batch_window=args.batch_window, max_queued_pages=args.max_queued_pages,
+                          max_requests=args.max_requests, cache_path=args.cache))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,8 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    **{name: "LayoutClassifier.labels" for name in ("LABELS", "COLOR_MAP", "to_label_json", "normalize_box")},
+    **{name: "LayoutClassifier.regionProposer" for name in ("propose_regions", "downsample")},
+    "LabelStore": "LayoutClassifier.labelStore",
+    **{name: "LayoutClassifier.rotationDetector" for name in ("page_rotations", "detect_orientations", "text_layer_orientation")},
+})
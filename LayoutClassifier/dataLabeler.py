@@ -1,8 +1,11 @@
 import tkinter as tk
-from PIL import Image, ImageTk
+from collections import OrderedDict
+from PIL import ImageTk
 import os
-import fitz
-import json
+
+from LayoutClassifier.labels import LABELS, COLOR_MAP
+from LayoutClassifier.labelStore import LabelStore
+from LayoutClassifier.pageCache import PageRenderCache, MAX_CACHED_PAGES
 
 class ImageLabelingApp:
     def __init__(self, root, data_folder):
@@ -18,14 +21,16 @@ class ImageLabelingApp:
         self.bbox_start = None
         self.bbox_end = None
         self.bboxes = []
-        self.labels = ["Title", "Subtitle", "Paragraph", "Table", "Other"]
-        self.color_map = {
-            "Title": "red",
-            "Subtitle": "blue",
-            "Paragraph": "green",
-            "Table": "orange",
-            "Other": "purple"
-        }
+        self.labels = LABELS
+        self.color_map = COLOR_MAP
+
+        # Rendered pages are cached and the neighbouring ones prefetched, and
+        # PhotoImages (which can only be built on the Tk thread) are kept too
+        self.page_cache = PageRenderCache()
+        self.photo_cache = OrderedDict()
+        # Canvas items of the box being dragged, moved instead of redrawn
+        self.drag_items = None
+        self.label_store = LabelStore()
 
         self.create_widgets()
         
@@ -54,7 +59,7 @@ class ImageLabelingApp:
         self.next_file_button = tk.Button(self.root, text="Next File", command=self.next_file)
         self.next_file_button.pack()
 
-        self.clear_page_button = tk.Button(self.root, text="Clear Labels for Page", command=self.clear_page_labels)
+        self.clear_page_button = tk.Button(self.root, text="Clear Labels for Page", command=self.clear_stored_page_labels)
         self.clear_page_button.pack()
 
         # Load the first file (image or PDF)
@@ -65,50 +70,37 @@ class ImageLabelingApp:
         self.canvas.bind("<B1-Motion>", self.on_bounding_box_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_bounding_box_end)
 
+    def current_file_path(self):
+        return os.path.join(self.data_folder, self.file_list[self.current_file_index])
+
     def load_file(self):
-        current_file = self.file_list[self.current_file_index]
-        file_path = os.path.join(self.data_folder, current_file)
-
-        if current_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-            # Load image
-            self.image = Image.open(file_path)
-            self.tk_image = ImageTk.PhotoImage(self.image)
-            self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
-
-            # Draw existing bounding boxes
-            for bbox_info in self.bboxes:
-                label_id, bbox_coords = bbox_info
-                x1, y1, x2, y2 = bbox_coords
-                color = self.color_map.get(self.labels[int(label_id) - 1], '')
-                self.canvas.create_rectangle(x1, y1, x2, y2, outline=color)
-                self.canvas.create_text((x1 + x2) // 2, (y1 + y2) // 2, text=self.labels[int(label_id) - 1], fill="red")
-
-                # Draw the filled rectangle below the bottom right corner with the class color
-                text_x = max(x1, x2) - 100
-                text_y = max(y1, y2)
-                text_width = 100  
-                text_height = 20 
-                self.canvas.create_rectangle(text_x, text_y, text_x + text_width, text_y + text_height, fill=color)
-
-                # Draw the text label below the filled rectangle
-                text_label = self.labels[int(label_id) - 1]
-                self.canvas.create_text(text_x + text_width // 2, text_y + (text_height/2), text=text_label, fill="black")
-
-        elif current_file.lower().endswith('.pdf'):
-            # Load PDF
-            pdf_doc = fitz.open(file_path)
-            self.total_pages = pdf_doc.page_count
-            self.load_pdf_page()
+        file_path = self.current_file_path()
+        self.total_pages = self.page_cache.page_count(file_path)
+        self.load_pdf_page()
+
+    def get_photo(self, file_path, page_number):
+        key = (file_path, page_number)
+        photo = self.photo_cache.pop(key, None)
+        if photo is None:
+            photo = ImageTk.PhotoImage(self.page_cache.get_page(file_path, page_number))
+        self.photo_cache[key] = photo
+        while len(self.photo_cache) > MAX_CACHED_PAGES:
+            self.photo_cache.popitem(last=False)
+        return photo
 
     def load_pdf_page(self):
-        pdf_doc = fitz.open(os.path.join(self.data_folder, self.file_list[self.current_file_index]))
-        pdf_page = pdf_doc[self.current_page]
-        pix = pdf_page.get_pixmap()
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        self.tk_image = ImageTk.PhotoImage(img)
+        file_path = self.current_file_path()
+        self.tk_image = self.get_photo(file_path, self.current_page)
         self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
+        self.draw_bounding_boxes()
 
-        # Draw existing bounding boxes
+        # Render the pages the annotator is most likely to open next
+        neighbours = [(file_path, self.current_page + 1), (file_path, self.current_page - 1)]
+        if self.current_file_index + 1 < len(self.file_list):
+            neighbours.append((os.path.join(self.data_folder, self.file_list[self.current_file_index + 1]), 0))
+        self.page_cache.prefetch(*[key for key in neighbours if key[1] >= 0])
+
+    def draw_bounding_boxes(self):
         for bbox_info in self.bboxes:
             label_id, bbox_coords = bbox_info
             x1, y1, x2, y2 = bbox_coords
@@ -119,8 +111,8 @@ class ImageLabelingApp:
             # Draw the filled rectangle below the bottom right corner with the class color
             text_x = max(x1, x2) - 100
             text_y = max(y1, y2)
-            text_width = 100 
-            text_height = 20 
+            text_width = 100
+            text_height = 20
             self.canvas.create_rectangle(text_x, text_y, text_x + text_width, text_y + text_height, fill=color)
 
             # Draw the text label below the filled rectangle
@@ -132,24 +124,21 @@ class ImageLabelingApp:
 
     def next_page(self):
         if self.current_page < self.total_pages - 1:
-            self.save_bounding_boxes()
             self.current_page += 1
+            # clear_page_labels reloads the (now current) page from the cache
             self.clear_canvas()
             self.clear_page_labels()
-            self.load_pdf_page()
             self.bboxes = []
 
     def prev_page(self):
         if self.current_page > 0:
-            self.save_bounding_boxes()
             self.current_page -= 1
+            # clear_page_labels reloads the (now current) page from the cache
             self.clear_canvas()
             self.clear_page_labels()
-            self.load_pdf_page()
             self.bboxes = []
 
     def next_file(self):
-        self.save_bounding_boxes()
         self.current_file_index += 1
         self.current_page = 0
 
@@ -159,12 +148,12 @@ class ImageLabelingApp:
             self.bbox_end = None
             self.clear_canvas()
             self.clear_page_labels()
-            self.load_file()
         else:
             self.label_var.set("Labeling Complete!")
 
     def clear_canvas(self):
         self.canvas.delete("all")
+        self.drag_items = None
 
     def clear_page_labels(self):
         self.bbox_start = None
@@ -173,76 +162,46 @@ class ImageLabelingApp:
         self.clear_canvas()
         self.load_file()
 
-    def save_bounding_boxes(self):
-        label_id = self.label_var.get()
-        if label_id and self.bbox_start and self.bbox_end:
-            bbox_coords = (self.bbox_start[0], self.bbox_start[1], self.bbox_end[0], self.bbox_end[1])
-            self.bboxes.append((label_id, bbox_coords))
-            self.save_to_json()
+    def clear_stored_page_labels(self):
+        self.label_store.delete_page(self.file_list[self.current_file_index], self.current_page + 1)
+        self.clear_page_labels()
 
-    def save_to_json(self):
+    def save_to_store(self, label_id, bbox_coords):
+        # Each box is appended as soon as it is drawn, nothing is rewritten
         current_file = self.file_list[self.current_file_index]
-        json_file_name = os.path.splitext(current_file)[0] + "_labels.json"
-        json_file_path = os.path.join("ocrPipeline/trainingLabels", json_file_name)
-
-        label_id = self.label_var.get()
-        if label_id and self.bbox_start and self.bbox_end:
-            bbox_coords = (self.bbox_start[0], self.bbox_start[1], self.bbox_end[0], self.bbox_end[1])
-            self.bboxes.append((label_id, bbox_coords))
-
-        json_data = []
-        for bbox_info in self.bboxes:
-            label_id, bbox_coords = bbox_info
-            label_text = self.labels[int(label_id) - 1]
-            color = self.color_map.get(label_text, "black")
-            json_data.append({
-                "fileName": current_file,
-                "page": self.current_page + 1,
-                "textPos": [
-                    {"label": label_text, "boxCoords": bbox_coords, "color": color}
-                ]
-            })
-
-        with open(json_file_path, 'w') as json_file:
-            json.dump(json_data, json_file, indent=2)
-
+        self.label_store.append(current_file, self.current_page + 1, self.labels[int(label_id) - 1], bbox_coords)
 
     def on_bounding_box_start(self, event):
         self.bbox_start = (event.x, event.y)
+        self.bbox_end = None
 
-    def on_bounding_box_drag(self, event):
-        if self.bbox_start:
-            self.bbox_end = (event.x, event.y)
-            self.clear_canvas()
-            self.load_pdf_page()
-
-            # Draw existing bounding boxes
-            for bbox_info in self.bboxes:
-                label_id, bbox_coords = bbox_info
-                x1, y1, x2, y2 = bbox_coords
-                color = self.color_map.get(self.labels[int(label_id) - 1], 'black')
-                self.canvas.create_rectangle(x1, y1, x2, y2, outline=color)
-                self.canvas.create_text((x1 + x2) // 2, (y1 + y2) // 2, text=self.labels[int(label_id) - 1], fill="red")
+        label_id = self.label_var.get()
+        try:
+            text_label = self.labels[int(label_id) - 1]
+        except (ValueError, IndexError):
+            text_label = ""
+        color = self.color_map.get(text_label, 'black')
 
-            label_id = self.label_var.get()
-            color = self.color_map.get(self.labels[int(label_id) - 1], 'black')
+        # The box and its label tag are created once, dragging only moves them
+        self.drag_items = (
+            self.canvas.create_rectangle(event.x, event.y, event.x, event.y, outline=color),
+            self.canvas.create_rectangle(event.x - 100, event.y, event.x, event.y + 20, fill=color),
+            self.canvas.create_text(event.x - 50, event.y + 10, text=text_label, fill="black"),
+        )
 
-            # Draw the current bounding box
-            self.canvas.create_rectangle(self.bbox_start[0], self.bbox_start[1], self.bbox_end[0], self.bbox_end[1], outline=color)
+    def on_bounding_box_drag(self, event):
+        if self.bbox_start and self.drag_items:
+            self.bbox_end = (event.x, event.y)
+            box, tag, text = self.drag_items
+            self.canvas.coords(box, self.bbox_start[0], self.bbox_start[1], self.bbox_end[0], self.bbox_end[1])
 
-            # Draw the filled rectangle below the bottom right corner with the class color
+            # The filled rectangle with the class color sits below the bottom right corner
             text_x = max(self.bbox_start[0], self.bbox_end[0]) - 100
             text_y = max(self.bbox_start[1], self.bbox_end[1])
-            text_width = 100 
-            text_height = 20 
-            self.canvas.create_rectangle(text_x, text_y, text_x + text_width, text_y + text_height, fill=color)
-
-            # Draw the text label below the filled rectangle
-            try: 
-               text_label = self.labels[int(label_id) - 1]
-            except:
-               text_label = "" 
-            self.canvas.create_text(text_x + text_width // 2, text_y + text_height, text=text_label, fill="black")
+            text_width = 100
+            text_height = 20
+            self.canvas.coords(tag, text_x, text_y, text_x + text_width, text_y + text_height)
+            self.canvas.coords(text, text_x + text_width // 2, text_y + text_height // 2)
 
     def on_bounding_box_end(self, event):
         if self.bbox_start:
@@ -251,6 +210,7 @@ class ImageLabelingApp:
             if label_id:
                 bbox_coords = (self.bbox_start[0], self.bbox_start[1], self.bbox_end[0], self.bbox_end[1])
                 self.bboxes.append((label_id, bbox_coords))
+                self.save_to_store(label_id, bbox_coords)
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,126 @@
+from PIL import Image
+import numpy as np
+import fitz
+import json
+import os
+
+from LayoutClassifier.labels import LABELS
+
+# Pages are stored resized to a fixed shape so a shard is one plain array
+IMAGE_SIZE = (1024, 768)
+PAGES_PER_SHARD = 2048
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def load_page(file_path, page_number, image_size=IMAGE_SIZE):
+    # page_number is 1 based, like in the labels. Returns the page resized to
+    # image_size (height, width) in grayscale, plus its original size in the
+    # coordinates the boxes were drawn in (pixels of the image, points of a pdf)
+    height, width = image_size
+    if file_path.lower().endswith(IMAGE_EXTENSIONS):
+        with Image.open(file_path) as image:
+            original_size = image.size
+            page = np.asarray(image.convert("L").resize((width, height), Image.BILINEAR))
+        return page, original_size
+
+    with fitz.open(file_path) as doc:
+        pdf_page = doc[page_number - 1]
+        rect = pdf_page.rect
+        matrix = fitz.Matrix(width / rect.width, height / rect.height)
+        pix = pdf_page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY)
+        page = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+        if page.shape != (height, width):
+            page = np.asarray(Image.fromarray(page).resize((width, height), Image.BILINEAR))
+        return page, (rect.width, rect.height)
+
+
+def export_dataset(store, data_folder, output_path, image_size=IMAGE_SIZE, pages_per_shard=PAGES_PER_SHARD):
+    # Packs every labeled page of the store into shards of memory mappable
+    # .npy files: images (pages, height, width) uint8, boxes (boxes, 5) float32
+    # holding the label index and the box normalized to [0, 1], and offsets
+    # (pages + 1) pointing each page at its rows in boxes
+    os.makedirs(output_path, exist_ok=True)
+    pages = store.pages()
+    shards = []
+    for shard_index, first in enumerate(range(0, len(pages), pages_per_shard)):
+        shard_pages = pages[first:first + pages_per_shard]
+        name = f"shard-{shard_index:05d}"
+        images = np.lib.format.open_memmap(os.path.join(output_path, f"{name}-images.npy"), mode="w+",
+                                           dtype=np.uint8, shape=(len(shard_pages), *image_size))
+        boxes = []
+        offsets = [0]
+        for index, (file_name, page_number) in enumerate(shard_pages):
+            images[index], (width, height) = load_page(os.path.join(data_folder, file_name), page_number, image_size)
+            for entry in store.query(file_name, page_number):
+                for text_pos in entry["textPos"]:
+                    x1, y1, x2, y2 = text_pos["boxCoords"]
+                    boxes.append((LABELS.index(text_pos["label"]), x1 / width, y1 / height, x2 / width, y2 / height))
+            offsets.append(len(boxes))
+        images.flush()
+        del images
+        np.save(os.path.join(output_path, f"{name}-boxes.npy"), np.asarray(boxes, dtype=np.float32).reshape(-1, 5))
+        np.save(os.path.join(output_path, f"{name}-offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        shards.append({"name": name, "pages": [list(page) for page in shard_pages]})
+
+    with open(os.path.join(output_path, "index.json"), "w") as index_file:
+        json.dump({"labels": LABELS, "image_size": list(image_size), "shards": shards}, index_file)
+    return len(pages)
+
+
+class ShardedDataset:
+    # Random access over exported shards. Arrays are memory mapped, so opening
+    # the dataset reads nothing and a page costs one copy out of the page cache
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as index_file:
+            self.index = json.load(index_file)
+        self.labels = self.index["labels"]
+        self.shard_sizes = np.array([len(shard["pages"]) for shard in self.index["shards"]], dtype=np.int64)
+        self.shard_starts = np.concatenate(([0], np.cumsum(self.shard_sizes)))
+        self._shards = {}
+
+    def __len__(self):
+        return int(self.shard_starts[-1])
+
+    def shard(self, shard_index):
+        if shard_index not in self._shards:
+            name = os.path.join(self.path, self.index["shards"][shard_index]["name"])
+            self._shards[shard_index] = tuple(
+                np.load(f"{name}-{part}.npy", mmap_mode="r") for part in ("images", "boxes", "offsets")
+            )
+        return self._shards[shard_index]
+
+    def locate(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        shard_index = int(np.searchsorted(self.shard_starts, index, side="right")) - 1
+        return shard_index, index - int(self.shard_starts[shard_index])
+
+    def __getitem__(self, index):
+        # (image, boxes) with boxes as rows of (label index, x1, y1, x2, y2)
+        shard_index, local_index = self.locate(index)
+        images, boxes, offsets = self.shard(shard_index)
+        return images[local_index], boxes[offsets[local_index]:offsets[local_index + 1]]
+
+    def source(self, index):
+        shard_index, local_index = self.locate(index)
+        return tuple(self.index["shards"][shard_index]["pages"][local_index])
+
+    def iter_batches(self, batch_size=32, shuffle=True, seed=0):
+        # Shuffles the shard order and the pages within each shard, so batches
+        # are random while reads stay within one mapped file at a time
+        rng = np.random.default_rng(seed)
+        shard_order = rng.permutation(len(self.shard_sizes)) if shuffle else np.arange(len(self.shard_sizes))
+        batch_images, batch_boxes = [], []
+        for shard_index in shard_order:
+            images, boxes, offsets = self.shard(int(shard_index))
+            size = int(self.shard_sizes[shard_index])
+            order = rng.permutation(size) if shuffle else np.arange(size)
+            for local_index in order:
+                batch_images.append(images[local_index])
+                batch_boxes.append(np.array(boxes[offsets[local_index]:offsets[local_index + 1]]))
+                if len(batch_images) == batch_size:
+                    yield np.stack(batch_images), batch_boxes
+                    batch_images, batch_boxes = [], []
+        if batch_images:
+            yield np.stack(batch_images), batch_boxes
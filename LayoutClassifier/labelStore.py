@@ -0,0 +1,79 @@
+import glob
+import json
+import os
+import sqlite3
+
+from LayoutClassifier.labels import COLOR_MAP, normalize_box
+
+DEFAULT_STORE_PATH = "ocrPipeline/trainingLabels/labels.sqlite"
+LOCK_TIMEOUT = 30
+
+
+class LabelStore:
+    # All the boxes of the corpus in one indexed sqlite file. Boxes are only
+    # ever appended, so saving a box costs the same however many are stored,
+    # and they can be queried by file, page and label without reading the rest
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "id INTEGER PRIMARY KEY, file TEXT, page INTEGER, label TEXT, x1 REAL, y1 REAL, x2 REAL, y2 REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS labels_page ON labels (file, page)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS labels_label ON labels (label)")
+
+    def append(self, file_name, page, label, box_coords):
+        self.append_many([(file_name, page, label, box_coords)])
+
+    def append_many(self, boxes):
+        rows = [(file_name, page, label, *normalize_box(box_coords)) for file_name, page, label, box_coords in boxes]
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.executemany("INSERT INTO labels (file, page, label, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_page(self, file_name, page):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM labels WHERE file = ? AND page = ?", (file_name, page))
+
+    def query(self, file_name=None, page=None, label=None):
+        # Yields entries in the labeler's JSON format, in insertion order
+        conditions, values = [], []
+        for column, value in (("file", file_name), ("page", page), ("label", label)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.connection.execute(f"SELECT file, page, label, x1, y1, x2, y2 FROM labels{where} ORDER BY id", values)
+        for file_name, page, label, *box in cursor:
+            yield {
+                "fileName": file_name,
+                "page": page,
+                "textPos": [{"label": label, "boxCoords": tuple(box), "color": COLOR_MAP.get(label, "black")}]
+            }
+
+    def pages(self):
+        # Every labeled (file, page), sorted so pages of a file are together
+        return self.connection.execute("SELECT DISTINCT file, page FROM labels ORDER BY file, page").fetchall()
+
+    def counts(self):
+        return dict(self.connection.execute("SELECT label, COUNT(*) FROM labels GROUP BY label"))
+
+    def import_json(self, json_path):
+        # Loads a label file written by save_to_json or the synthetic generator
+        with open(json_path) as json_file:
+            entries = json.load(json_file)
+        self.append_many(
+            (entry["fileName"], entry["page"], text_pos["label"], text_pos["boxCoords"])
+            for entry in entries for text_pos in entry["textPos"]
+        )
+        return len(entries)
+
+    def import_directory(self, labels_path):
+        return sum(self.import_json(json_path) for json_path in sorted(glob.glob(os.path.join(labels_path, "*_labels.json"))))
+
+    def close(self):
+        self.connection.close()
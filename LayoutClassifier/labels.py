@@ -0,0 +1,29 @@
+LABELS = ["Title", "Subtitle", "Paragraph", "Table", "Other"]
+COLOR_MAP = {
+    "Title": "red",
+    "Subtitle": "blue",
+    "Paragraph": "green",
+    "Table": "orange",
+    "Other": "purple"
+}
+
+
+def normalize_box(box_coords):
+    # Boxes drawn in the labeler keep the corners in drag order
+    x1, y1, x2, y2 = box_coords
+    return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+
+def to_label_json(file_name, page_number, regions):
+    # Same entries ImageLabelingApp.save_to_json writes, one per box, so
+    # proposed and hand labeled pages can be used interchangeably
+    return [
+        {
+            "fileName": file_name,
+            "page": page_number,
+            "textPos": [
+                {"label": region["label"], "boxCoords": region["boxCoords"], "color": COLOR_MAP.get(region["label"], "black")}
+            ]
+        }
+        for region in regions
+    ]
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from PIL import Image
+import fitz
+import queue
+import threading
+
+MAX_OPEN_DOCUMENTS = 4
+MAX_CACHED_PAGES = 16
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+class PageRenderCache:
+    # Keeps documents open and the last rendered pages in memory, and renders
+    # the pages the annotator is likely to open next on a background thread.
+    # fitz is not thread safe, every access to it goes through the lock
+    def __init__(self, max_documents=MAX_OPEN_DOCUMENTS, max_pages=MAX_CACHED_PAGES):
+        self.max_documents = max_documents
+        self.max_pages = max_pages
+        self.documents = OrderedDict()
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+        self.prefetch_queue = queue.Queue()
+        self.prefetch_thread = threading.Thread(target=self._prefetch_worker, daemon=True)
+        self.prefetch_thread.start()
+
+    def _document(self, file_path):
+        doc = self.documents.pop(file_path, None)
+        if doc is None:
+            doc = fitz.open(file_path)
+        self.documents[file_path] = doc
+        while len(self.documents) > self.max_documents:
+            _, oldest = self.documents.popitem(last=False)
+            oldest.close()
+        return doc
+
+    def page_count(self, file_path):
+        if file_path.lower().endswith(IMAGE_EXTENSIONS):
+            return 1
+        with self.lock:
+            return self._document(file_path).page_count
+
+    def get_page(self, file_path, page_number):
+        key = (file_path, page_number)
+        with self.lock:
+            image = self.pages.pop(key, None)
+            if image is None:
+                image = self._render(file_path, page_number)
+            self.pages[key] = image
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+        return image
+
+    def _render(self, file_path, page_number):
+        if file_path.lower().endswith(IMAGE_EXTENSIONS):
+            with Image.open(file_path) as image:
+                return image.convert("RGB")
+        pix = self._document(file_path)[page_number].get_pixmap()
+        return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    def prefetch(self, *keys):
+        # Newer requests replace older ones that have not started yet, the
+        # annotator has already moved past them
+        while not self.prefetch_queue.empty():
+            try:
+                self.prefetch_queue.get_nowait()
+            except queue.Empty:
+                break
+        for key in keys:
+            self.prefetch_queue.put(key)
+
+    def _prefetch_worker(self):
+        while True:
+            file_path, page_number = self.prefetch_queue.get()
+            try:
+                if page_number < self.page_count(file_path):
+                    self.get_page(file_path, page_number)
+            except Exception:
+                # A file that fails here fails again, with a proper error, when
+                # it is actually opened
+                pass
+
+    def close(self):
+        with self.lock:
+            for doc in self.documents.values():
+                doc.close()
+            self.documents.clear()
+            self.pages.clear()
@@ -0,0 +1,173 @@
+import numpy as np
+
+# Everything below works on whole arrays at a time, the only Python loops are
+# over regions, never over pixels. Distances are in points so the same
+# settings hold whatever resolution the page was rendered at
+INK_THRESHOLD = 160
+# Gaps up to these sizes are smeared over (run-length smoothing), joining the
+# letters of a line and the lines of a paragraph
+HORIZONTAL_SMEAR = 10
+VERTICAL_SMEAR = 6
+# Whitespace at least this wide splits a region in two during the XY cut
+MIN_ROW_GAP = 6
+MIN_COLUMN_GAP = 14
+MIN_REGION_AREA = 40
+# A region whose line height is this many times the page's typical one is a
+# title or subtitle
+TITLE_RATIO = 1.8
+SUBTITLE_RATIO = 1.2
+# A block the XY cut would split in at least this many columns, all of them
+# narrower than TABLE_MAX_COLUMN_WIDTH and with TABLE_MIN_ROWS lines each, is
+# kept whole as a table
+TABLE_MIN_COLUMNS = 3
+TABLE_MAX_COLUMN_WIDTH = 120
+TABLE_MIN_ROWS = 3
+# Single lines in these top/bottom fractions of the page are headers/footers.
+# Titles are set at the top too, and at the layout resolution the lines of
+# small body text merge, so their height can't tell them apart: at the top only
+# lines narrower than HEADER_MAX_WIDTH of the page (page numbers) are skipped
+MARGIN_FRACTION = 0.06
+HEADER_MAX_WIDTH = 0.1
+
+
+def downsample(gray, factor):
+    # Block minimum, so thin strokes survive the reduction. Taken as the minimum
+    # of factor*factor strided views, which is far cheaper than reshaping
+    if factor <= 1:
+        return gray
+    height, width = gray.shape[0] // factor, gray.shape[1] // factor
+    views = [gray[row::factor, column::factor][:height, :width] for row in range(factor) for column in range(factor)]
+    return np.minimum.reduce(views)
+
+
+def smear(ink, gap, axis):
+    # Fills runs of background no longer than gap that have ink on both sides.
+    # Every row is padded with background so the whole image can be scanned as
+    # one flat array, runs that cross the padding are the page edges
+    if axis == 0:
+        return smear(np.ascontiguousarray(ink.T), gap, 1).T
+    height, width = ink.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = ink
+    changes = np.diff(padded.ravel())
+    # Changes alternate ink start / ink end, starting with an ink start
+    gap_starts = np.flatnonzero(changes == -1)[:-1] + 1
+    gap_stops = np.flatnonzero(changes == 1)[1:] + 1
+    keep = (gap_stops - gap_starts <= gap) & (gap_starts // (width + 2) == gap_stops // (width + 2))
+
+    # Starts and stops are all distinct positions, so plain assignment is enough
+    fill = np.zeros(padded.size + 1, dtype=np.int8)
+    fill[gap_starts[keep]] = 1
+    fill[gap_stops[keep]] = -1
+    filled = np.cumsum(fill[:-1], dtype=np.int8).reshape(height, width + 2)[:, 1:-1] > 0
+    return ink | filled
+
+
+def runs(mask):
+    # (start, stop) of every run of True values in a 1D mask
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return edges[::2], edges[1::2]
+
+
+def xy_cut(mask, ink, min_row_gap, min_column_gap, max_table_column):
+    # Recursively splits the mask along the whitespace rows and columns of its
+    # projection profiles. Returns tight (x0, y0, x1, y1) boxes and the subset
+    # of them that look like tables
+    boxes = []
+    tables = set()
+    pending = [(0, 0, mask.shape[1], mask.shape[0])]
+    while pending:
+        x0, y0, x1, y1 = pending.pop()
+        block = mask[y0:y1, x0:x1]
+        rows = block.any(axis=1)
+        columns = block.any(axis=0)
+        if not rows.any():
+            continue
+        # Trim to the ink first
+        row_starts, row_stops = runs(rows)
+        column_starts, column_stops = runs(columns)
+        top, bottom = row_starts[0], row_stops[-1]
+        left, right = column_starts[0], column_stops[-1]
+
+        row_cuts = np.flatnonzero(row_starts[1:] - row_stops[:-1] >= min_row_gap)
+        if len(row_cuts):
+            bounds = np.concatenate(([row_starts[0]], row_starts[row_cuts + 1]))
+            ends = np.concatenate((row_stops[row_cuts], [row_stops[-1]]))
+            pending.extend((x0 + left, y0 + start, x0 + right, y0 + stop) for start, stop in zip(bounds, ends))
+            continue
+
+        box = (x0 + left, y0 + top, x0 + right, y0 + bottom)
+        column_cuts = np.flatnonzero(column_starts[1:] - column_stops[:-1] >= min_column_gap)
+        if len(column_cuts):
+            bounds = np.concatenate(([column_starts[0]], column_starts[column_cuts + 1]))
+            ends = np.concatenate((column_stops[column_cuts], [column_stops[-1]]))
+            if is_table(ink[y0:y1, x0:x1], bounds, ends, max_table_column):
+                boxes.append(box)
+                tables.add(box)
+                continue
+            pending.extend((x0 + start, y0 + top, x0 + stop, y0 + bottom) for start, stop in zip(bounds, ends))
+            continue
+
+        boxes.append(box)
+    return boxes, tables
+
+
+def is_table(ink, starts, ends, max_column_width):
+    if len(starts) < TABLE_MIN_COLUMNS or (ends - starts).max() > max_column_width:
+        return False
+    # Lines are counted on the ink, the smeared mask has them joined
+    return all(len(runs(ink[:, start:stop].any(axis=1))[0]) >= TABLE_MIN_ROWS for start, stop in zip(starts, ends))
+
+
+def line_heights(ink, box):
+    x0, y0, x1, y1 = box
+    starts, stops = runs(ink[y0:y1, x0:x1].any(axis=1))
+    return stops - starts
+
+
+def classify_region(ink, box, page_line_height, page_shape, is_table):
+    heights = line_heights(ink, box)
+    line_count = len(heights)
+    ratio = float(np.median(heights)) / page_line_height if page_line_height else 1.0
+    x0, y0, x1, y1 = box
+    page_height, page_width = page_shape
+
+    if is_table:
+        return "Table"
+    at_top = y1 < page_height * MARGIN_FRACTION and x1 - x0 < page_width * HEADER_MAX_WIDTH
+    at_bottom = y0 > page_height * (1 - MARGIN_FRACTION)
+    if line_count == 1 and ratio < SUBTITLE_RATIO and (at_top or at_bottom):
+        return "Other"
+    if line_count <= 3 and ratio >= TITLE_RATIO:
+        return "Title"
+    if line_count <= 3 and ratio >= SUBTITLE_RATIO:
+        return "Subtitle"
+    return "Paragraph"
+
+
+def propose_regions(gray, points_per_pixel=1.0):
+    # gray is a (downsampled) page raster, points_per_pixel converts its pixels
+    # back to page points. Returns [{"label", "boxCoords"}] in points, the
+    # boxCoords the labeler and OCRPipeline use
+    ink = gray < INK_THRESHOLD
+    if not ink.any():
+        return []
+
+    to_pixels = 1 / points_per_pixel
+    smeared = smear(ink, HORIZONTAL_SMEAR * to_pixels, axis=1) & smear(ink, VERTICAL_SMEAR * to_pixels, axis=0)
+    smeared = smear(smeared, HORIZONTAL_SMEAR * to_pixels, axis=1)
+    boxes, tables = xy_cut(smeared, ink, max(MIN_ROW_GAP * to_pixels, 1), max(MIN_COLUMN_GAP * to_pixels, 1),
+                           TABLE_MAX_COLUMN_WIDTH * to_pixels)
+
+    min_area = MIN_REGION_AREA * to_pixels * to_pixels
+    boxes = [box for box in boxes if (box[2] - box[0]) * (box[3] - box[1]) >= min_area]
+    if not boxes:
+        return []
+    # The typical line height on the page, weighted by how many lines use it
+    page_line_height = float(np.median(np.concatenate([line_heights(ink, box) for box in boxes])))
+
+    regions = []
+    for box in sorted(boxes, key=lambda box: (box[1], box[0])):
+        label = classify_region(ink, box, page_line_height, gray.shape, box in tables)
+        regions.append({"label": label, "boxCoords": tuple(int(round(value * points_per_pixel)) for value in box)})
+    return regions
@@ -0,0 +1,260 @@
+import fitz
+import numpy as np
+
+# Orientation and skew are measured on thumbnails rendered at this resolution.
+# Lower, the ascenders of small print (6 to 8 points) blur into the x-height
+DETECTION_DPI = 75
+# Pixels lighter than this are background. The others count with their
+# darkness, the thin strokes of ascenders are too faint at this resolution to
+# survive a hard ink threshold
+BACKGROUND_LEVEL = 224
+# Pages with less ink than this many black pixels are left as they are
+MIN_INK = 800
+# The skew is searched in whole degrees, then in quarters around the best one
+MAX_SKEW = 5.0
+SKEW_STEP = 1.0
+COARSE_ANGLES = np.arange(-MAX_SKEW, MAX_SKEW + 0.5, SKEW_STEP)
+FINE_ANGLES = np.arange(-0.5, 0.75, 0.25)
+# Skews below the search step are left alone, tesseract reads them just as
+# well, and so are peaks that beat the energy of the unrotated page by less
+# than SKEW_MARGIN: columns whose lines don't line up make shallow peaks a
+# degree or so off on upright pages
+MIN_SKEW = SKEW_STEP
+SKEW_MARGIN = 0.03
+# Pixels sampled per page for the skew, plenty for whole page profiles
+MAX_SKEW_PIXELS = 3000
+# Side of the square tiles the orientation is read from, an inch
+TILE = DETECTION_DPI
+# A profile bin belongs to a text line when it holds this fraction of the
+# fullest bin of its tile, and to the x-height band of the line when it holds
+# this fraction of the fullest bin of the line
+LINE_FRACTION = 0.15
+BAND_FRACTION = 0.5
+MIN_LINE_BINS = 3
+# Weight of the alignment of the lines against their x-height asymmetry when
+# telling up from down, the first is a much smaller number
+EDGE_WEIGHT = 4
+# Pages whose text layer has at least this many characters take their
+# orientation from it and skip the detection
+MIN_TEXT_CHARS = 16
+
+
+def text_layer_orientation(page, min_chars=MIN_TEXT_CHARS):
+    # Counterclockwise quarter turns of the text as the page renders, from the
+    # writing direction of the lines of its text layer, or None when there is
+    # too little text to tell. Directions are in unrotated page space, the
+    # page rotation turns them further (clockwise) when rendering
+    votes = np.zeros(4)
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        for line in block.get("lines", ()):
+            cos, sin = line["dir"]
+            turns = int(round(np.degrees(np.arctan2(-sin, cos)) / 90)) % 4
+            votes[turns] += sum(len(span["text"].strip()) for span in line["spans"])
+    if votes.sum() < min_chars:
+        return None
+    return (int(votes.argmax()) - page.rotation // 90) % 4
+
+
+def render_thumbnail(page, dpi=DETECTION_DPI):
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+
+def ink_pixels(images):
+    # Coordinates and darkness of the non background pixels of every image,
+    # with the image each one belongs to
+    found = []
+    for index, image in enumerate(images):
+        ys, xs = np.nonzero(image < BACKGROUND_LEVEL)
+        found.append((np.full(len(ys), index), ys, xs, 255 - image[ys, xs]))
+    owners, ys, xs, darkness = (np.concatenate(arrays) for arrays in zip(*found))
+    sizes = np.array([image.shape for image in images], dtype=np.float64)
+    return owners, ys, xs, darkness.astype(np.float64), sizes
+
+
+def sample(owners, count, limit):
+    # A random share of the pixels of each image so none keeps more than about
+    # limit. Every nth pixel would leave a lattice on solid areas (pictures,
+    # shading) whose rows line up at a slant and fake a skew. Seeded, so a
+    # page always gets the same rotation
+    counts = np.bincount(owners, minlength=count)
+    shares = limit / np.maximum(counts, limit)
+    return np.random.default_rng(0).random(len(owners)) < shares[owners]
+
+
+def page_profiles(owners, ys, xs, sizes, angles):
+    # Ink counts of the whole pages across their rows and columns turned by
+    # each of their angles (pages, angles in degrees), with a single bincount.
+    # Shape (pages, 2, angles, bins)
+    pages, count = angles.shape
+    radius = int(np.ceil(np.hypot(*sizes.max(axis=0)) / 2)) + 1
+    bins = 2 * radius + 1
+    # Centered on whole pixels, half pixel positions would round two rows into
+    # one bin at angle 0 and fake a peak there
+    centers = sizes // 2
+    ys = (ys - centers[owners, 0]).astype(np.float32)
+    xs = (xs - centers[owners, 1]).astype(np.float32)
+    radians = np.radians(angles).T
+    sin = np.sin(radians).astype(np.float32)[:, owners]
+    cos = np.cos(radians).astype(np.float32)[:, owners]
+    # Positions are shifted to be positive, so truncating rounds them
+    shift = np.float32(radius + 0.5)
+    offsets = ((owners * 2 * count)[None] + np.arange(count)[:, None]) * bins
+    flat = np.empty((2, count, len(ys)), dtype=np.int64)
+    flat[0] = offsets + (xs * sin + ys * cos + shift).astype(np.int64)
+    flat[1] = offsets + (xs * cos - ys * sin + shift).astype(np.int64) + count * bins
+    profiles = np.bincount(flat.ravel(), minlength=pages * 2 * count * bins)
+    return profiles.reshape(pages, 2, count, bins).astype(np.float64)
+
+
+def skew_energies(owners, ys, xs, sizes, angles):
+    # Text lines make the profile across them peaky, which the sum of squares
+    # rewards. Both axes turn with the page, so their energies are added up
+    # relative to their best: short lines give broad peaks that the sharp
+    # column edges pin down, and an axis without lines stays flat
+    energies = (page_profiles(owners, ys, xs, sizes, angles) ** 2).sum(axis=3)
+    return (energies / np.maximum(energies.max(axis=2, keepdims=True), 1e-9)).sum(axis=1)
+
+
+def tile_profiles(owners, ys, xs, weights, sizes, angles):
+    # Profiles of every TILE x TILE tile of the pages, across the rows and the
+    # columns turned by the angle (radians) of their page. Columns of text
+    # that do not line up blur the whole page profiles, not these.
+    # Shape (pages, tiles, 2, bins)
+    pages = len(sizes)
+    tile_columns = int(-(-sizes[:, 1].max() // TILE))
+    tile_count = int(-(-sizes[:, 0].max() // TILE)) * tile_columns
+    tiles = (ys // TILE) * tile_columns + xs // TILE
+    radius = int(np.ceil(TILE / np.sqrt(2))) + 1
+    bins = 2 * radius + 1
+    local_ys = (ys % TILE - TILE // 2).astype(np.float32)
+    local_xs = (xs % TILE - TILE // 2).astype(np.float32)
+    sin = np.sin(angles).astype(np.float32)[owners]
+    cos = np.cos(angles).astype(np.float32)[owners]
+    shift = np.float32(radius + 0.5)
+    offsets = (owners * tile_count + tiles) * 2 * bins
+    flat = np.empty((2, len(ys)), dtype=np.int64)
+    flat[0] = offsets + (local_xs * sin + local_ys * cos + shift).astype(np.int64)
+    flat[1] = offsets + (local_xs * cos - local_ys * sin + shift).astype(np.int64) + bins
+    profiles = np.bincount(flat.ravel(), weights=np.tile(weights, 2), minlength=pages * tile_count * 2 * bins)
+    return profiles.reshape(pages, tile_count, 2, bins)
+
+
+def refine_peak(angles, energies):
+    # Angle of the energy peak of each page, from a parabola through the best
+    # of its angles (evenly spaced) and its neighbours
+    best = energies.argmax(axis=1)
+    inner = (best > 0) & (best < energies.shape[1] - 1)
+    rows = np.arange(len(best))
+    left = energies[rows, np.maximum(best - 1, 0)]
+    center = energies[rows, best]
+    right = energies[rows, np.minimum(best + 1, energies.shape[1] - 1)]
+    curvature = left - 2 * center + right
+    offset = np.where(inner & (curvature < 0), 0.5 * (left - right) / np.where(curvature < 0, curvature, -1), 0)
+    return angles[rows, best] + offset * (angles[:, 1] - angles[:, 0])
+
+
+def upright_scores(profiles):
+    # profiles is (pages, tiles, bins), across the lines of the tiles. Latin
+    # text has far more ascenders and capitals than descenders, so a line has
+    # more ink above its x-height band than below it. Returns per page the
+    # balance of the two over all lines, positive for text that reads along
+    # increasing bins. The first and last line of a tile may be cut by its
+    # edge and are left out
+    pages, tiles, bins = profiles.shape
+    flat = profiles.ravel()
+    lines = profiles > LINE_FRACTION * profiles.max(axis=2, keepdims=True)
+    lines[:, :, 0] = lines[:, :, -1] = False
+    changes = np.diff(lines.ravel().astype(np.int8))
+    starts = np.flatnonzero(changes == 1) + 1
+    ends = np.flatnonzero(changes == -1) + 1
+    owners = starts // bins
+    inner = np.ones(len(starts), dtype=bool)
+    inner[:-1] &= owners[:-1] == owners[1:]
+    inner[1:] &= owners[1:] == owners[:-1]
+    keep = inner & (ends - starts >= MIN_LINE_BINS)
+    starts, ends, owners = starts[keep], ends[keep], owners[keep] // tiles
+    if not len(starts):
+        return np.zeros(pages)
+
+    # Every bin of every line, to find where the band of each line starts and ends
+    lengths = ends - starts
+    line_ids = np.repeat(np.arange(len(starts)), lengths)
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[line_ids]
+    peaks = np.maximum.reduceat(flat, np.stack((starts, ends), axis=1).ravel())[::2]
+    band = flat[positions] > BAND_FRACTION * peaks[line_ids]
+    band_positions, band_lines = positions[band], line_ids[band]
+    band_starts = band_positions[np.searchsorted(band_lines, np.arange(len(starts)), "left")]
+    band_ends = band_positions[np.searchsorted(band_lines, np.arange(len(starts)), "right") - 1] + 1
+
+    ink = np.concatenate(([0], np.cumsum(flat)))
+    above = ink[band_starts] - ink[starts]
+    below = ink[ends] - ink[band_ends]
+    total = np.bincount(owners, weights=above + below, minlength=pages)
+    return np.bincount(owners, weights=above - below, minlength=pages) / np.maximum(total, 1)
+
+
+def edge_scores(profiles):
+    # profiles is (pages, tiles, bins), along the lines of the tiles. Text is
+    # mostly left aligned, so lines start at a sharp edge and end ragged: the
+    # profiles rise in steps and fall in slopes. Returns per page the balance
+    # of the two, positive for lines that start at the low bins. Justified
+    # and centered text leave it near 0
+    steps = np.diff(profiles, axis=2)
+    rises = (np.maximum(steps, 0) ** 2).sum(axis=(1, 2))
+    falls = (np.minimum(steps, 0) ** 2).sum(axis=(1, 2))
+    return (rises - falls) / np.maximum(rises + falls, 1)
+
+
+def detect_orientations(images):
+    # Returns, per grayscale page image, the counterclockwise rotation in
+    # degrees that puts its text upright and level: a multiple of 90 for the
+    # orientation plus the skew. Pages with too little ink get 0
+    if not len(images):
+        return []
+    owners, ys, xs, weights, sizes = ink_pixels(images)
+    pages = np.arange(len(images))
+
+    # The skew is the angle with the most energy, found on a sample of the ink.
+    # The unrotated page is scored along with the fine angles, the last column
+    sampled = sample(owners, len(images), MAX_SKEW_PIXELS)
+    sampled = owners[sampled], ys[sampled], xs[sampled], sizes
+    coarse = np.broadcast_to(COARSE_ANGLES, (len(images), len(COARSE_ANGLES)))
+    fine = np.round(refine_peak(coarse, skew_energies(*sampled, coarse)) * 4)[:, None] / 4 + FINE_ANGLES
+    energies = skew_energies(*sampled, np.concatenate((fine, np.zeros((len(images), 1))), axis=1))
+    skews = refine_peak(fine, energies[:, :-1])
+    level = (energies[:, :-1].max(axis=1) < energies[:, -1] * (1 + SKEW_MARGIN)) | (np.abs(skews) < MIN_SKEW)
+    skews[level] = 0
+
+    # The axis the lines run along is the one with the peakier tiles, the
+    # profiles across the lines and along them tell which way is up. Upright
+    # lines along the columns read towards the low bins
+    tiles = tile_profiles(owners, ys, xs, weights, sizes, np.radians(skews))
+    axes = (tiles ** 2).sum(axis=(1, 3)).argmax(axis=1)
+    edges = edge_scores(tiles[pages, :, 1 - axes]) * np.where(axes == 0, 1, -1)
+    upright = upright_scores(tiles[pages, :, axes]) + EDGE_WEIGHT * edges >= 0
+
+    # Quarter turns the content is away from upright: 0 or 2 for lines along
+    # the rows, 1 or 3 along the columns
+    turns = np.where(axes == 0, np.where(upright, 0, 2), np.where(upright, 1, 3))
+    rotations = -90 * turns - skews
+    rotations[np.bincount(owners, weights=weights, minlength=len(images)) < MIN_INK * 255] = 0
+    return [float(rotation) for rotation in rotations]
+
+
+def page_rotations(pages, dpi=DETECTION_DPI):
+    # Rotation to render each fitz page with so its text comes out upright.
+    # Pages with a text layer get it from the direction of their text, the
+    # others are detected together from thumbnails
+    rotations = [0.0] * len(pages)
+    detect = []
+    for index, page in enumerate(pages):
+        turns = text_layer_orientation(page)
+        if turns is None:
+            detect.append(index)
+        else:
+            rotations[index] = float(-90 * turns)
+    found = detect_orientations([render_thumbnail(pages[index], dpi) for index in detect])
+    for index, rotation in zip(detect, found):
+        rotations[index] = rotation
+    return rotations
@@ -0,0 +1,8 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    **{name: "OCRPipeline.regionOcr" for name in (
+        "ocr_page", "ocr_pages", "ocr_regions", "render_page", "crop_regions", "propose_page_regions",
+        "RENDER_DPI", "OCR_LANGUAGE", "OCR_LABELS", "TARGET_TEXT_HEIGHT", "LAYOUT_DOWNSAMPLE")},
+    **{name: "OCRPipeline.imageOcr" for name in ("ocr_image", "iter_image_ocr")},
+})
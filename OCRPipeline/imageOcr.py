@@ -0,0 +1,18 @@
+import numpy as np
+from PIL import Image
+
+from OCRPipeline.regionOcr import ocr_regions, prepare_region
+
+
+def ocr_image(image):
+    # A standalone image is read as a single region, still scaled to the size
+    # of its text
+    return ocr_regions([prepare_region(np.asarray(image.convert("L")))])[0]
+
+
+def iter_image_ocr(file_path):
+    # Multi-frame images (tiff) are yielded one frame at a time
+    with Image.open(file_path) as image:
+        for frame in range(getattr(image, "n_frames", 1)):
+            image.seek(frame)
+            yield ocr_image(image)
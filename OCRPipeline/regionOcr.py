@@ -0,0 +1,193 @@
+import fitz
+import numpy as np
+from PIL import Image
+import pytesseract
+
+import LayoutClassifier
+import Telemetry
+from LayoutClassifier.labels import normalize_box
+
+# Pages are rendered once at this resolution, regions with large text are
+# downsampled from it instead of being rendered again
+RENDER_DPI = 300
+# Height in pixels tesseract reads best, regions are scaled to bring their text
+# lines close to it
+TARGET_TEXT_HEIGHT = 32
+MIN_REGION_DPI = 100
+# When no layout boxes are given they are proposed on the page raster reduced
+# by this factor (50 dpi), which is plenty to find blocks of text
+LAYOUT_DOWNSAMPLE = 6
+OCR_LANGUAGE = "eng"
+# Only these layout labels are read, footers, watermarks, etc are skipped
+OCR_LABELS = ("Title", "Subtitle", "Paragraph", "Table")
+# Pixels darker than this count as ink
+INK_THRESHOLD = 160
+# Regions from one or more pages are stacked into strips no taller than this,
+# so tesseract is started once per strip rather than once per region
+MAX_STRIP_HEIGHT = 6000
+REGION_GAP = 40
+
+
+def render_page(page, dpi=RENDER_DPI, rotation=0):
+    # The array is a view over the pixmap samples, not a copy, so the pixmap
+    # must stay alive as long as the array (and any crop of it) is used.
+    # rotation (counterclockwise degrees) is applied by the renderer, which
+    # costs nothing over a plain render and leaves no black corners. Device
+    # space has y pointing down, so fitz angles turn clockwise on screen
+    if rotation:
+        matrix = fitz.Matrix(dpi / 72, dpi / 72).prerotate(-rotation)
+        pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY)
+    else:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    array = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return pix, array
+
+
+def crop_regions(array, regions, dpi=RENDER_DPI):
+    # Region boxes are in points (72 dpi), like the labeler and fitz use.
+    # Crops are slices of the page array, nothing is copied here
+    scale = dpi / 72
+    height, width = array.shape
+    crops = []
+    for region in sorted(regions, key=lambda region: normalize_box(region["boxCoords"])[1::-1]):
+        if region["label"] not in OCR_LABELS:
+            continue
+        x0, y0, x1, y1 = normalize_box(region["boxCoords"])
+        x0, y0 = max(int(x0 * scale), 0), max(int(y0 * scale), 0)
+        x1, y1 = min(int(np.ceil(x1 * scale)), width), min(int(np.ceil(y1 * scale)), height)
+        if x1 > x0 and y1 > y0:
+            crops.append(array[y0:y1, x0:x1])
+    return crops
+
+
+def estimate_text_height(crop):
+    # Median height of the runs of consecutive rows that contain ink, which
+    # for a block of text is the height of its lines
+    ink_rows = np.concatenate(([False], (crop < INK_THRESHOLD).any(axis=1), [False]))
+    edges = np.flatnonzero(ink_rows[1:] != ink_rows[:-1])
+    if not len(edges):
+        return 0
+    runs = edges[1::2] - edges[::2]
+    return float(np.median(runs))
+
+
+def region_dpi(crop, dpi=RENDER_DPI):
+    text_height = estimate_text_height(crop)
+    if not text_height:
+        return dpi
+    return int(np.clip(dpi * TARGET_TEXT_HEIGHT / text_height, MIN_REGION_DPI, dpi))
+
+
+def prepare_region(crop, dpi=RENDER_DPI):
+    # The returned image never shares memory with the crop, so the page raster
+    # can be released as soon as its regions are prepared
+    target_dpi = region_dpi(crop, dpi)
+    image = Image.fromarray(crop)
+    if target_dpi >= dpi:
+        return image.copy()
+    scale = target_dpi / dpi
+    size = (max(int(crop.shape[1] * scale), 1), max(int(crop.shape[0] * scale), 1))
+    return image.resize(size, Image.BILINEAR)
+
+
+def build_strips(images):
+    # Groups consecutive regions in strips of at most MAX_STRIP_HEIGHT pixels,
+    # with white space between them so tesseract never joins two regions
+    strips = []
+    current = []
+    height = 0
+    for index, image in enumerate(images):
+        if current and height + image.height > MAX_STRIP_HEIGHT:
+            strips.append(current)
+            current, height = [], 0
+        current.append(index)
+        height += image.height + REGION_GAP
+    if current:
+        strips.append(current)
+    return strips
+
+
+def ocr_strip(images):
+    # Returns the text of each image, read with a single tesseract call
+    width = max(image.width for image in images) + 2 * REGION_GAP
+    height = sum(image.height + REGION_GAP for image in images) + REGION_GAP
+    strip = Image.new("L", (width, height), 255)
+    bounds = []
+    top = REGION_GAP
+    for image in images:
+        strip.paste(image, (REGION_GAP, top))
+        bounds.append(top + image.height)
+        top += image.height + REGION_GAP
+
+    data = pytesseract.image_to_data(strip, lang=OCR_LANGUAGE, config="--psm 4", output_type=pytesseract.Output.DICT)
+    return split_words(data, bounds)
+
+
+def split_words(data, bounds):
+    # Words are handed back to the region their vertical center falls in,
+    # keeping tesseract's line structure
+    bottoms = np.asarray(bounds)
+    lines = [dict() for _ in bounds]
+    for text, top, word_height, block, paragraph, line in zip(
+            data["text"], data["top"], data["height"], data["block_num"], data["par_num"], data["line_num"]):
+        if not text.strip():
+            continue
+        region = min(int(np.searchsorted(bottoms, top + word_height / 2)), len(bounds) - 1)
+        lines[region].setdefault((block, paragraph, line), []).append(text)
+    return ["".join(" ".join(words) + "\n" for words in region_lines.values()) for region_lines in lines]
+
+
+def ocr_regions(images):
+    # Only the regions that reach the engine, not the ones dropped before OCR
+    Telemetry.count('ocr_regions', len(images))
+    texts = []
+    for strip in build_strips(images):
+        with Telemetry.span('ocr_engine', regions=len(strip)):
+            texts.extend(ocr_strip([images[index] for index in strip]))
+    return texts
+
+
+def ocr_pages(pages, regions=None, dpi=RENDER_DPI):
+    # OCRs several pages with one batch of engine calls. regions holds, per
+    # page, the layout boxes to read ({"label", "boxCoords"} like the layout
+    # classifier outputs); boxes are proposed from the raster for pages that
+    # come without them. Those pages are also turned upright and deskewed
+    # first, the given boxes are in the coordinates of the page as it is
+    images = []
+    owners = []
+    rotations = [0.0] * len(pages)
+    detect = [index for index in range(len(pages)) if not regions or regions[index] is None]
+    if detect:
+        with Telemetry.span('orientation', pages=len(detect)):
+            for index, rotation in zip(detect, LayoutClassifier.page_rotations([pages[index] for index in detect])):
+                rotations[index] = rotation
+        Telemetry.count('pages_rotated', sum(1 for rotation in rotations if rotation))
+    for index, page in enumerate(pages):
+        with Telemetry.span('render'):
+            pix, array = render_page(page, dpi, rotations[index])
+        if regions and regions[index] is not None:
+            page_regions = regions[index]
+        else:
+            with Telemetry.span('layout'):
+                page_regions = propose_page_regions(array, dpi)
+        with Telemetry.span('prepare_regions'):
+            for crop in crop_regions(array, page_regions, dpi):
+                images.append(prepare_region(crop, dpi))
+                owners.append(index)
+        # Only one page raster is alive at a time
+        del pix, array
+
+    texts = [""] * len(pages)
+    if images:
+        for owner, text in zip(owners, ocr_regions(images)):
+            texts[owner] += text
+    return texts
+
+
+def propose_page_regions(array, dpi=RENDER_DPI):
+    layout = LayoutClassifier.downsample(array, LAYOUT_DOWNSAMPLE)
+    return LayoutClassifier.propose_regions(layout, 72 * LAYOUT_DOWNSAMPLE / dpi)
+
+
+def ocr_page(page, regions=None, dpi=RENDER_DPI):
+    return ocr_pages([page], [regions], dpi)[0]
@@ -0,0 +1,8 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "clean_text": "PostProcessing.textCleanup",
+    **{name: "PostProcessing.symSpell" for name in (
+        "SymSpellIndex", "build_index", "load_word_counts", "count_words", "damerau_levenshtein", "DEFAULT_INDEX_PATH")},
+    **{name: "PostProcessing.pipeline" for name in ("postprocess_text", "get_index", "dictionary_id")},
+})
@@ -0,0 +1,34 @@
+import os
+
+import Telemetry
+from PostProcessing.symSpell import DEFAULT_INDEX_PATH, SymSpellIndex
+from PostProcessing.textCleanup import clean_text
+
+_indexes = {}
+
+
+def get_index(path=DEFAULT_INDEX_PATH):
+    # Opened once per process, None when no index has been built yet, in which
+    # case OCR output only gets the cleanup rules. A missing index is looked
+    # for again on the next call, so one built later is picked up
+    if path not in _indexes:
+        if not os.path.exists(path):
+            return None
+        _indexes[path] = SymSpellIndex(path)
+    return _indexes[path]
+
+
+def dictionary_id(path=DEFAULT_INDEX_PATH):
+    # Identifies the word list the OCR output was corrected with, for cache keys
+    index = get_index(path)
+    return index.build_id if index is not None else None
+
+
+def postprocess_text(text, ocr=False, index_path=DEFAULT_INDEX_PATH):
+    # Spelling correction is only run on OCR output, a text layer has no typos
+    # of its own to fix
+    with Telemetry.span('postprocess'):
+        index = get_index(index_path) if ocr else None
+        if index is None:
+            return clean_text(text)
+        return index.correct_text(clean_text(text, index.__contains__))
@@ -0,0 +1,262 @@
+import argparse
+from collections import Counter
+from functools import lru_cache
+import hashlib
+import os
+import re
+
+import numpy as np
+
+# Next to the code rather than the working directory, so the index is found
+# wherever the extractor is run from
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "data", "dictionaries", "words.symspell")
+MAX_EDIT_DISTANCE = 2
+# Deletes are only generated from the first characters of each word, which
+# keeps the index small. Candidates are checked on the full word afterwards
+PREFIX_LENGTH = 7
+# Words this short only get corrected by one edit, two would turn them into
+# almost anything
+SHORT_WORD_LENGTH = 4
+WORD_CACHE_SIZE = 1 << 16
+WORD_PATTERN = re.compile(r"[^\W\d_]{3,}")
+DICTIONARY_WORD = re.compile(r"[^\W\d_]+")
+
+MAGIC = b"SYMSPEL1"
+# The arrays after the header are all 8 byte aligned so they can be viewed in
+# place from the memory map
+HEADER = np.dtype([
+    ("magic", "S8"),
+    ("max_distance", "<u4"),
+    ("prefix_length", "<u4"),
+    ("words", "<u8"),
+    ("entries", "<u8"),
+    ("text_size", "<u8"),
+    ("build_id", "S16"),
+    ("reserved", "V8"),
+])
+
+
+def delete_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def deletes(word, max_distance, prefix_length):
+    # The prefix of word with up to max_distance characters removed, the
+    # prefix itself included
+    prefix = word[:prefix_length]
+    found = {prefix}
+    edge = [prefix]
+    for _ in range(max_distance):
+        next_edge = []
+        for candidate in edge:
+            if len(candidate) <= 1:
+                continue
+            for index in range(len(candidate)):
+                deleted = candidate[:index] + candidate[index + 1:]
+                if deleted not in found:
+                    found.add(deleted)
+                    next_edge.append(deleted)
+        edge = next_edge
+    return found
+
+
+def damerau_levenshtein(a, b, max_distance):
+    # Optimal string alignment distance, or None as soon as it is certain to
+    # be above max_distance
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    # Only the part between the common prefix and suffix can hold edits
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return max(len(a), len(b))
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_minimum = i
+        for j in range(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current[j] = value
+            row_minimum = min(row_minimum, value)
+        if row_minimum > max_distance:
+            return None
+        before_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+def load_word_counts(path):
+    # One word per line, optionally followed by its frequency
+    # ("word 1234", the format of the SymSpell frequency dictionaries)
+    counts = Counter()
+    with open(path, encoding="utf-8") as word_file:
+        for line in word_file:
+            fields = line.split()
+            if not fields or not DICTIONARY_WORD.fullmatch(fields[0]):
+                continue
+            counts[fields[0].lower()] += int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 1
+    return counts
+
+
+def count_words(paths):
+    # Word frequencies of plain text files, to build a dictionary from a corpus
+    counts = Counter()
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as text_file:
+            for line in text_file:
+                counts.update(word.lower() for word in DICTIONARY_WORD.findall(line))
+    return counts
+
+
+def build_index(word_counts, output_path=DEFAULT_INDEX_PATH, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+    # Writes the symmetric delete index of word_counts ({word: frequency}):
+    # the sorted 64 bit hashes of every delete with the id of the word it came
+    # from, then the frequencies and the words themselves
+    words = sorted(word_counts)
+    hashes = []
+    word_ids = []
+    for word_id, word in enumerate(words):
+        for deleted in deletes(word, max_distance, prefix_length):
+            hashes.append(delete_hash(deleted))
+            word_ids.append(word_id)
+    hashes = np.array(hashes, dtype=np.uint64)
+    word_ids = np.array(word_ids, dtype=np.uint32)
+    order = np.lexsort((word_ids, hashes))
+    hashes, word_ids = hashes[order], word_ids[order]
+
+    encoded = [word.encode() for word in words]
+    offsets = np.zeros(len(words) + 1, dtype=np.uint64)
+    np.cumsum([len(word) for word in encoded], out=offsets[1:])
+    counts = np.array([word_counts[word] for word in words], dtype=np.uint64)
+    lengths = np.array([min(len(word), 255) for word in words], dtype=np.uint8)
+    text = b"".join(encoded)
+
+    build_id = hashlib.blake2b(digest_size=16)
+    build_id.update(f"{max_distance}:{prefix_length}".encode())
+    for word, count in zip(encoded, counts.tolist()):
+        build_id.update(word + b"\0" + str(count).encode() + b"\n")
+
+    header = np.zeros(1, dtype=HEADER)
+    header[0] = (MAGIC, max_distance, prefix_length, len(words), len(hashes), len(text), build_id.digest(), b"")
+
+    # Written next to the target and renamed, so a worker never maps half a file
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    temporary_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as index_file:
+        for array in (header, hashes, word_ids, counts, lengths, offsets):
+            index_file.write(array.tobytes())
+            index_file.write(b"\0" * (-array.nbytes % 8))
+        index_file.write(text)
+    os.replace(temporary_path, output_path)
+    return output_path
+
+
+class SymSpellIndex:
+    # Read only view of an index written by build_index. The file is memory
+    # mapped rather than read, so every process using it shares the same pages
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        header = self.data[:HEADER.itemsize].view(HEADER)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a symspell index")
+        self.max_distance = int(header["max_distance"])
+        self.prefix_length = int(header["prefix_length"])
+        self.build_id = header["build_id"].hex()
+
+        offset = HEADER.itemsize
+        self.hashes, offset = self._array(offset, np.uint64, int(header["entries"]))
+        self.word_ids, offset = self._array(offset, np.uint32, int(header["entries"]))
+        self.counts, offset = self._array(offset, np.uint64, int(header["words"]))
+        self.lengths, offset = self._array(offset, np.uint8, int(header["words"]))
+        self.offsets, offset = self._array(offset, np.uint64, int(header["words"]) + 1)
+        self.text = self.data[offset:offset + int(header["text_size"])].view(np.ndarray)
+        self.correct_word = lru_cache(maxsize=WORD_CACHE_SIZE)(self._correct_word)
+
+    def _array(self, offset, dtype, length):
+        end = offset + length * np.dtype(dtype).itemsize
+        # Plain ndarray views, numpy's memmap subclass is slow to index
+        return self.data[offset:end].view(np.ndarray).view(dtype), end + (-end % 8)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def word(self, word_id):
+        return self.text[self.offsets[word_id]:self.offsets[word_id + 1]].tobytes().decode()
+
+    def _matching_ids(self, keys):
+        hashes = np.fromiter((delete_hash(key) for key in keys), dtype=np.uint64)
+        starts = np.searchsorted(self.hashes, hashes, "left")
+        ends = np.searchsorted(self.hashes, hashes, "right")
+        found = ends > starts
+        if not found.any():
+            return np.empty(0, dtype=np.uint32)
+        return np.unique(np.concatenate([self.word_ids[start:end] for start, end in zip(starts[found], ends[found])]))
+
+    def __contains__(self, word):
+        return any(self.word(word_id) == word for word_id in self._matching_ids([word[:self.prefix_length]]))
+
+    def lookup(self, word, max_distance=None):
+        # (dictionary word, distance, frequency) of the closest match, fewest
+        # edits first then most frequent, or None if nothing is close enough
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best = None
+        word_ids = self._matching_ids(deletes(word, max_distance, self.prefix_length))
+        # Words sharing a prefix with word but too long or short to be within reach
+        word_ids = word_ids[np.abs(self.lengths[word_ids].astype(np.int64) - len(word)) <= max_distance]
+        for word_id in word_ids.tolist():
+            candidate = self.word(word_id)
+            distance = 0 if candidate == word else damerau_levenshtein(word, candidate, max_distance)
+            if distance is None:
+                continue
+            count = int(self.counts[word_id])
+            if best is None or (distance, -count) < (best[1], -best[2]):
+                best = (candidate, distance, count)
+                if distance == 0:
+                    break
+        return best
+
+    def _correct_word(self, word):
+        # Acronyms and mixed case words (names, codes) are left alone
+        if not (word.islower() or word.istitle()):
+            return word
+        lower = word.lower()
+        if lower in self:
+            return word
+        match = self.lookup(lower, 1 if len(word) <= SHORT_WORD_LENGTH else self.max_distance)
+        if match is None or match[1] == 0:
+            return word
+        return match[0].capitalize() if word[0].isupper() else match[0]
+
+    def correct_text(self, text):
+        return WORD_PATTERN.sub(lambda match: self.correct_word(match.group()), text)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Build the spelling correction index used on OCR output")
+    parser.add_argument("--words", nargs="*", default=[], help="word lists, one word and optional frequency per line")
+    parser.add_argument("--corpus", nargs="*", default=[], help="plain text files to count words from")
+    parser.add_argument("--output", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--max-distance", type=int, default=MAX_EDIT_DISTANCE)
+    parser.add_argument("--prefix-length", type=int, default=PREFIX_LENGTH)
+    args = parser.parse_args(argv)
+
+    counts = count_words(args.corpus)
+    for path in args.words:
+        counts.update(load_word_counts(path))
+    if not counts:
+        parser.error("no words given, use --words or --corpus")
+    build_index(counts, args.output, args.max_distance, args.prefix_length)
+    print(f"Indexed {len(counts)} words in {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,63 @@
+import re
+
+# Characters fixed one for one, applied in a single str.translate pass
+CHARACTER_MAP = str.maketrans({
+    # Ligatures left in the text layer by the pdf fonts
+    "\ufb00": "ff",
+    "\ufb01": "fi",
+    "\ufb02": "fl",
+    "\ufb03": "ffi",
+    "\ufb04": "ffl",
+    "\ufb05": "st",
+    "\ufb06": "st",
+    # Soft hyphens and zero width characters only break up words
+    "\u00ad": None,
+    "\u200b": None,
+    "\u200c": None,
+    "\u200d": None,
+    "\ufeff": None,
+    "\r": None,
+    # Hyphen variants, so line end hyphenation is caught whatever the font used
+    "\u2010": "-",
+    "\u2011": "-",
+    # Unusual spaces
+    "\u00a0": " ",
+    "\u2007": " ",
+    "\u2009": " ",
+    "\u200a": " ",
+    "\u202f": " ",
+    "\u3000": " ",
+})
+
+# Every rule is a named alternative of one pattern, so the text is only
+# scanned once whatever the number of rules
+CLEANUP_PATTERN = re.compile(
+    # A word split over two lines with a hyphen
+    r"(?P<head>\w*[^\W\d_])-[ \t]*\n[ \t]*(?P<tail>[^\W\d_]\w*)"
+    r"|(?P<trailing>[ \t]+(?=\n|$))"
+    r"|(?P<spaces>[ \t]{2,}|\t)"
+    r"|(?P<blank>\n{3,})"
+)
+
+
+def clean_text(text, is_word=None):
+    # is_word, when given, tells the words broken by the line ("exam-ple") from
+    # the ones that carry their own hyphen ("well-known"). Without it every
+    # hyphen at the end of a line followed by a lowercase word is joined
+    def replace(match):
+        head = match.group("head")
+        if head is not None:
+            tail = match.group("tail")
+            if not tail[0].islower():
+                return f"{head}-\n{tail}"
+            joined = head + tail
+            if is_word is None or is_word(joined.lower()) or not (is_word(head.lower()) and is_word(tail.lower())):
+                return joined
+            return f"{head}-{tail}"
+        if match.group("trailing") is not None:
+            return ""
+        if match.group("spaces") is not None:
+            return " "
+        return "\n\n"
+
+    return CLEANUP_PATTERN.sub(replace, text.translate(CHARACTER_MAP))
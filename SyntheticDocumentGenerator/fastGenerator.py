@@ -0,0 +1,167 @@
+from functools import lru_cache
+from multiprocessing import Pool
+from matplotlib import font_manager
+from PIL import Image, ImageDraw, ImageFont
+
+import numpy as np
+import json
+import random
+import os
+
+from LayoutClassifier.labels import to_label_json
+from SyntheticDocumentGenerator.DocumentGenerator import (
+    DOCUMENT_OUTPUT_PATH, DOCUMENT_LABELS_OUTPUT_PATH, PH_TITLE, PH_SUBTITLE, PH_PARAGRAPH
+)
+
+# Text blocks are rendered once with PIL and pasted onto the pages with numpy,
+# there is no matplotlib figure per section. Block widths are rounded to this
+# step so the same rendered block is reused across pages
+WIDTH_STEP = 32
+TEXT_BLOCK_CACHE_SIZE = 2048
+PARAGRAPH_FONT_SIZES = (10, 12, 14)
+SUBTITLE_FONT_SIZES = (18, 20, 24)
+TITLE_FONT_SIZES = (28, 34, 40)
+LINE_SPACING = 1.25
+SECTION_PADDING = 8
+# Pages handed to a worker at a time
+CHUNK_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def load_font(size, bold=False):
+    properties = font_manager.FontProperties(family="DejaVu Sans", weight="bold" if bold else "normal")
+    return ImageFont.truetype(font_manager.findfont(properties), size)
+
+
+@lru_cache(maxsize=None)
+def word_length(word, size, bold=False):
+    return load_font(size, bold).getlength(word)
+
+
+def wrap_text(text, size, width, bold=False):
+    # Line widths are summed from cached word widths, kerning across the
+    # spaces is small enough to ignore for synthetic pages
+    space = word_length(" ", size, bold)
+    lines = []
+    for paragraph in text.strip().split("\n"):
+        line, line_width = [], 0
+        for word in paragraph.split():
+            length = word_length(word, size, bold)
+            if line and line_width + space + length > width:
+                lines.append(" ".join(line))
+                line, line_width = [], 0
+            line_width += length + (space if line else 0)
+            line.append(word)
+        if line:
+            lines.append(" ".join(line))
+    return lines
+
+
+@lru_cache(maxsize=TEXT_BLOCK_CACHE_SIZE)
+def render_text_block(text, font_size, width, bold=False):
+    # Returns a grayscale array exactly as tall as the wrapped text needs
+    font = load_font(font_size, bold)
+    lines = wrap_text(text, font_size, width, bold)
+    line_height = int(font_size * LINE_SPACING)
+    image = Image.new("L", (width, max(line_height * len(lines), 1)), 255)
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        draw.text((0, row * line_height), line, font=font, fill=0)
+    block = np.asarray(image)
+    block.setflags(write=False)
+    return block
+
+
+def paste_block(page, block, x, y, max_height):
+    # Pastes as much of the block as fits and returns its ink bounding box on
+    # the page, or None if nothing was drawn
+    height = min(block.shape[0], max_height, page.shape[0] - y)
+    width = min(block.shape[1], page.shape[1] - x)
+    if height <= 0 or width <= 0:
+        return None
+    block = block[:height, :width]
+    target = page[y:y + height, x:x + width]
+    np.minimum(target, block, out=target)
+
+    rows = np.flatnonzero((block < 255).any(axis=1))
+    columns = np.flatnonzero((block < 255).any(axis=0))
+    if not len(rows):
+        return None
+    return (x + int(columns[0]), y + int(rows[0]), x + int(columns[-1]) + 1, y + int(rows[-1]) + 1)
+
+
+def generate_page(rng, min_x=600, min_y=800, max_x=1000, max_y=1600, min_margin=0, max_margin=40,
+                  max_vertical_sections=5, max_horizontal_sections=5):
+    # Same section structure as generate_synthetic_document: rows of sections,
+    # each row with an optional title and each section with an optional subtitle
+    width, height = rng.randint(min_x, max_x), rng.randint(min_y, max_y)
+    page = np.full((height, width), 255, dtype=np.uint8)
+    margin = (rng.randint(min_margin, max_margin), rng.randint(min_margin, max_margin))
+    vertical_sections = rng.randint(1, max_vertical_sections)
+    section_height = height // vertical_sections
+    regions = []
+
+    def add(label, text, font_size, x, y, block_width, max_height, bold=False):
+        block_width = max(block_width // WIDTH_STEP * WIDTH_STEP, WIDTH_STEP)
+        block = render_text_block(text, font_size, block_width, bold)
+        box = paste_block(page, block, x, y, max_height)
+        if box:
+            regions.append({"label": label, "boxCoords": box})
+        return min(block.shape[0], max_height)
+
+    for j in range(vertical_sections):
+        top = j * section_height + margin[1] // 2
+        bottom = (j + 1) * section_height - margin[1] // 2
+        if rng.random() < 0.5:
+            top += add("Title", PH_TITLE, rng.choice(TITLE_FONT_SIZES), margin[0], top, width - 2 * margin[0],
+                       bottom - top, bold=True) + SECTION_PADDING
+
+        horizontal_sections = rng.randint(1, max_horizontal_sections)
+        section_width = width // horizontal_sections
+        for k in range(horizontal_sections):
+            left = k * section_width + margin[0] // 2
+            right = (k + 1) * section_width - margin[0] // 2
+            y = top
+            if rng.random() < 0.5:
+                y += add("Subtitle", PH_SUBTITLE, rng.choice(SUBTITLE_FONT_SIZES), left, y, right - left,
+                         bottom - y, bold=True) + SECTION_PADDING
+            if bottom - y > 0:
+                add("Paragraph", PH_PARAGRAPH, rng.choice(PARAGRAPH_FONT_SIZES), left, y, right - left, bottom - y)
+
+    return page, regions
+
+
+def write_page(index, seed, output_path=DOCUMENT_OUTPUT_PATH, labels_path=DOCUMENT_LABELS_OUTPUT_PATH, **page_options):
+    # Every page gets its own generator seeded from (seed, index), so the output
+    # is the same however many workers there are and in whatever order they run
+    rng = random.Random(f"{seed}-{index}")
+    page, regions = generate_page(rng, **page_options)
+    file_name = f"{index}.png"
+    Image.fromarray(page).save(os.path.join(output_path, file_name), compress_level=1)
+    with open(os.path.join(labels_path, f"{index}_labels.json"), "w") as json_file:
+        json.dump(to_label_json(file_name, 1, regions), json_file)
+
+
+def _write_pages(task):
+    indices, seed, output_path, labels_path, page_options = task
+    for index in indices:
+        write_page(index, seed, output_path, labels_path, **page_options)
+    return len(indices)
+
+
+def generate_documents(amount=1000, workers=None, seed=0, start=0, output_path=DOCUMENT_OUTPUT_PATH,
+                       labels_path=DOCUMENT_LABELS_OUTPUT_PATH, **page_options):
+    os.makedirs(output_path, exist_ok=True)
+    os.makedirs(labels_path, exist_ok=True)
+    tasks = [
+        (range(first, min(first + CHUNK_SIZE, start + amount)), seed, output_path, labels_path, page_options)
+        for first in range(start, start + amount, CHUNK_SIZE)
+    ]
+    if workers == 1:
+        return sum(map(_write_pages, tasks))
+    with Pool(workers) as pool:
+        return sum(pool.imap_unordered(_write_pages, tasks))
+
+
+if __name__ == '__main__':
+    generate_documents()
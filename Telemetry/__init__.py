@@ -0,0 +1 @@
+from Telemetry.tracer import span, count, recording, is_recording, metrics, prometheus_text, Tracer, NULL_SPAN
@@ -0,0 +1,212 @@
+from contextlib import contextmanager
+import contextvars
+import json
+import threading
+import time
+
+METRIC_PREFIX = "text_extractor"
+PROFILE_STATS_LINES = 40
+
+# The tracer of the request being extracted, None when tracing is off. That
+# is the only thing the hot path looks at, so disabled tracing costs one
+# context variable lookup per span
+_current_tracer = contextvars.ContextVar("text_extractor_tracer", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.id = None
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.id = self.tracer.open_span(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.close_span(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "span": self.name,
+            "id": self.id,
+            "parent": self.parent.id if self.parent else None,
+            "start": round(self.start - self.tracer.started, 6),
+            "duration": round(self.duration, 6),
+            **self.attributes,
+        }
+
+
+class Tracer:
+    # Records the spans and counters of one request. Spans nest per thread, a
+    # span opened inside another becomes its child
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.profile_stats = None
+        self._next_id = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        stack = getattr(self._local, "stack", None)
+        return Span(self, name, stack[-1] if stack else None, attributes)
+
+    def open_span(self, span):
+        self._local.__dict__.setdefault("stack", []).append(span)
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def close_span(self, span):
+        stack = self._local.stack
+        if span in stack:
+            stack.remove(span)
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stage_totals(self):
+        # {span name: (count, seconds)}
+        totals = {}
+        for span in self.spans:
+            count, seconds = totals.get(span.name, (0, 0.0))
+            totals[span.name] = (count + 1, seconds + span.duration)
+        return totals
+
+    def to_dict(self):
+        return {
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda span: span.id)],
+            "counters": dict(self.counters),
+            "profile": self.profile_stats,
+        }
+
+    def json_lines(self):
+        # One structured log line per span, then one with the counters
+        for span in sorted(self.spans, key=lambda span: span.id):
+            yield json.dumps({"event": "span", **span.to_dict()}, default=str)
+        yield json.dumps({"event": "counters", **self.counters})
+
+    def log(self, logger=None, level=None):
+        # logging, like the profiler below, is only imported when used, every
+        # extraction imports this module
+        import logging
+
+        logger = logger or logging.getLogger("text_extractor")
+        for line in self.json_lines():
+            logger.log(logging.INFO if level is None else level, line)
+
+    def prometheus(self):
+        return prometheus_text(self.counters, self.stage_totals())
+
+
+class MetricsRegistry:
+    # Process wide totals of every traced request, for scraping
+    def __init__(self):
+        self.counters = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def merge(self, tracer):
+        with self._lock:
+            for name, value in tracer.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, (count, seconds) in tracer.stage_totals().items():
+                total_count, total_seconds = self.stages.get(name, (0, 0.0))
+                self.stages[name] = (total_count + count, total_seconds + seconds)
+
+    def prometheus(self):
+        with self._lock:
+            return prometheus_text(self.counters, self.stages)
+
+
+metrics = MetricsRegistry()
+
+
+def prometheus_text(counters, stages, prefix=METRIC_PREFIX):
+    lines = []
+    for name, value in sorted(counters.items()):
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    if stages:
+        metric = f"{prefix}_stage_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for name, (count, seconds) in sorted(stages.items()):
+            lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {seconds:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def span(name, **attributes):
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return NULL_SPAN
+    return tracer.span(name, **attributes)
+
+
+def count(name, value=1):
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.count(name, value)
+
+
+def is_recording():
+    return _current_tracer.get() is not None
+
+
+@contextmanager
+def recording(profile=False, aggregate=True):
+    # Traces everything extracted inside the block. With profile the block also
+    # runs under cProfile and the top functions end up in tracer.profile_stats.
+    # With aggregate the totals are added to the process wide metrics
+    tracer = Tracer()
+    token = _current_tracer.set(tracer)
+    if profile:
+        import cProfile
+        import io
+        import pstats
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield tracer
+    finally:
+        if profiler:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_STATS_LINES)
+            tracer.profile_stats = output.getvalue()
+        _current_tracer.reset(token)
+        if aggregate:
+            metrics.merge(tracer)
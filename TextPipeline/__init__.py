@@ -0,0 +1,8 @@
+from Dispatcher.registry import lazy_exports
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "extract_page_text": "TextPipeline.pdfText",
+    "iter_plain_text": "TextPipeline.plainText",
+    **{name: "TextPipeline.officeText" for name in ("iter_docx_text", "iter_pptx_slides", "iter_pptx_text")},
+    "iter_html_text": "TextPipeline.htmlText",
+})
@@ -0,0 +1,86 @@
+from html.parser import HTMLParser
+import re
+
+READ_CHUNK_SIZE = 1 << 16
+TEXT_BLOCK_SIZE = 1 << 16
+
+# Tags whose content is never text for the reader
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "title", "svg"}
+# Tags that start a new line when they open or close
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li",
+    "main", "nav", "ol", "p", "pre", "section", "table", "tr", "ul",
+}
+CELL_TAGS = {"td", "th"}
+WHITESPACE = re.compile(r"\s+")
+
+
+class HtmlTextParser(HTMLParser):
+    # The file is fed in chunks and the text is handed out in blocks as soon as
+    # they fill up, the DOM is never built
+    def __init__(self, block_size=TEXT_BLOCK_SIZE):
+        super().__init__(convert_charrefs=True)
+        self.block_size = block_size
+        self.skip_depth = 0
+        self.line = []
+        self.block = []
+        self.block_length = 0
+        self.blocks = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.end_line()
+        elif tag in CELL_TAGS and self.line:
+            self.line.append("\t")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.end_line()
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.end_line()
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        text = WHITESPACE.sub(" ", data)
+        if text.strip() or (self.line and text):
+            self.line.append(text)
+
+    def end_line(self):
+        line = "".join(self.line).strip()
+        self.line = []
+        if not line:
+            return
+        self.block.append(line + "\n")
+        self.block_length += len(line) + 1
+        if self.block_length >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.block:
+            self.blocks.append("".join(self.block))
+            self.block = []
+            self.block_length = 0
+
+    def drain(self):
+        blocks, self.blocks = self.blocks, []
+        return blocks
+
+
+def iter_html_text(file_path, block_size=TEXT_BLOCK_SIZE):
+    parser = HtmlTextParser(block_size)
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace") as html_file:
+        for chunk in iter(lambda: html_file.read(READ_CHUNK_SIZE), ""):
+            parser.feed(chunk)
+            yield from parser.drain()
+    parser.close()
+    parser.end_line()
+    parser.flush()
+    yield from parser.drain()
@@ -0,0 +1,315 @@
+from xml.etree import ElementTree
+from xml.parsers import expat
+import posixpath
+import zipfile
+
+# Office files are parsed with expat straight from the compressed ZIP member,
+# one chunk at a time. No element tree is ever built for the document body,
+# so memory stays flat however large the XML is
+READ_CHUNK_SIZE = 1 << 16
+# Paragraphs are grouped in blocks of roughly this many characters
+TEXT_BLOCK_SIZE = 1 << 16
+# Office geometry is stored in EMUs, the labeler and fitz work in points
+EMU_PER_POINT = 12700
+# Placeholders without geometry of their own take it from the layout, and the
+# layout from the master, which only has the generic types
+PLACEHOLDER_TYPES = {"ctrTitle": "title", "subTitle": "body", "obj": "body"}
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main "
+A = "http://schemas.openxmlformats.org/drawingml/2006/main "
+P = "http://schemas.openxmlformats.org/presentationml/2006/main "
+R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+MC = "http://schemas.openxmlformats.org/markup-compatibility/2006 "
+PACKAGE_RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+SLIDE_LAYOUT = R + "/slideLayout"
+SLIDE_MASTER = R + "/slideMaster"
+
+# Tag names are compared on every parser event, so they are built once here
+W_T, W_P, W_TAB, W_BR, W_CR, W_BODY = (W + tag for tag in ("t", "p", "tab", "br", "cr", "body"))
+MC_FALLBACK = MC + "Fallback"
+
+
+def iter_events(stream, handler):
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    parser.CharacterDataHandler = handler.data
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+        parser.Parse(chunk, False)
+        yield from handler.drain()
+    parser.Parse(b"", True)
+    yield from handler.drain()
+
+
+class DocxHandler:
+    # Text boxes are written twice inside mc:AlternateContent, as DrawingML in
+    # mc:Choice and again as VML in mc:Fallback; only the first is read. Their
+    # paragraphs sit inside the paragraph anchoring the box, which is put
+    # aside on a stack until the box is done
+    def __init__(self, block_size=TEXT_BLOCK_SIZE):
+        self.block_size = block_size
+        self.in_text = False
+        self.paragraph = []
+        self.outer_paragraphs = []
+        self.fallback_depth = 0
+        self.block = []
+        self.block_length = 0
+        self.blocks = []
+
+    def start(self, name, attributes):
+        if name == MC_FALLBACK:
+            self.fallback_depth += 1
+        elif self.fallback_depth:
+            return
+        elif name == W_P:
+            self.outer_paragraphs.append(self.paragraph)
+            self.paragraph = []
+        elif name == W_T:
+            self.in_text = True
+        elif name == W_TAB:
+            self.paragraph.append("\t")
+        elif name == W_BR or name == W_CR:
+            self.paragraph.append("\n")
+
+    def end(self, name):
+        if name == MC_FALLBACK:
+            self.fallback_depth -= 1
+        elif self.fallback_depth:
+            return
+        elif name == W_T:
+            self.in_text = False
+        elif name == W_P:
+            paragraph = "".join(self.paragraph) + "\n"
+            self.paragraph = self.outer_paragraphs.pop() if self.outer_paragraphs else []
+            self.block.append(paragraph)
+            self.block_length += len(paragraph)
+            if self.block_length >= self.block_size:
+                self.flush()
+        elif name == W_BODY:
+            self.flush()
+
+    def data(self, text):
+        if self.in_text and not self.fallback_depth:
+            self.paragraph.append(text)
+
+    def flush(self):
+        if self.block:
+            self.blocks.append("".join(self.block))
+            self.block = []
+            self.block_length = 0
+
+    def drain(self):
+        blocks, self.blocks = self.blocks, []
+        return blocks
+
+
+def iter_docx_text(file_path, block_size=TEXT_BLOCK_SIZE):
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open("word/document.xml") as stream:
+            yield from iter_events(stream, DocxHandler(block_size))
+
+
+class SlideHandler:
+    # Collects the text of every shape on a slide together with its bounding
+    # box in points. Shapes inside groups are mapped through the group
+    # transforms so their boxes are in slide coordinates. Placeholders are
+    # listed as (type, idx, box, shape) whether they have text or not, layouts
+    # and masters are parsed the same way for their geometry
+    SHAPES = (P + "sp", P + "graphicFrame", P + "cxnSp")
+
+    def __init__(self):
+        self.shapes = []
+        self.placeholders = []
+        self.shape = None
+        self.in_text = False
+        # Stack of (offset x, offset y, scale x, scale y) for nested groups
+        self.groups = [(0, 0, 1.0, 1.0)]
+        self.in_group_properties = False
+        self.xfrm = None
+        # Where the text of the table cell being read starts
+        self.cell_start = None
+
+    def start(self, name, attributes):
+        if name in self.SHAPES and self.shape is None:
+            self.shape = {"text": [], "box": None, "placeholder": None}
+        elif name == P + "grpSp":
+            # Until its own xfrm is read a group places children like its parent
+            self.groups.append(self.groups[-1])
+        elif name == P + "grpSpPr":
+            self.in_group_properties = True
+        elif name in (A + "xfrm", P + "xfrm"):
+            self.xfrm = {}
+        elif self.xfrm is not None and name in (A + "off", A + "chOff"):
+            self.xfrm[name[len(A):]] = (int(attributes["x"]), int(attributes["y"]))
+        elif self.xfrm is not None and name in (A + "ext", A + "chExt"):
+            self.xfrm[name[len(A):]] = (int(attributes["cx"]), int(attributes["cy"]))
+        elif self.shape is not None:
+            if name == P + "ph":
+                self.shape["placeholder"] = (attributes.get("type", "obj"), attributes.get("idx"))
+            elif name == A + "t":
+                self.in_text = True
+            elif name == A + "br":
+                self.shape["text"].append("\n")
+            elif name == A + "tc":
+                self.cell_start = len(self.shape["text"])
+
+    def end(self, name):
+        if name in (A + "xfrm", P + "xfrm"):
+            self.close_xfrm()
+        elif name == P + "grpSp":
+            self.groups.pop()
+        elif name == P + "grpSpPr":
+            self.in_group_properties = False
+        elif self.shape is None:
+            return
+        elif name == A + "t":
+            self.in_text = False
+        elif name == A + "p":
+            self.shape["text"].append("\n")
+        elif name == A + "tc":
+            # Cells are separated by tabs and rows by newlines, paragraphs
+            # inside a cell are joined on one line
+            text = self.shape["text"]
+            text[self.cell_start:] = [" ".join("".join(text[self.cell_start:]).split()), "\t"]
+            self.cell_start = None
+        elif name == A + "tr":
+            if self.shape["text"][-1:] == ["\t"]:
+                self.shape["text"][-1] = "\n"
+        elif name in self.SHAPES:
+            text = "".join(self.shape["text"]).strip()
+            shape = {"text": text, "boxCoords": self.shape["box"]} if text else None
+            if shape:
+                self.shapes.append(shape)
+            if self.shape["placeholder"]:
+                self.placeholders.append((*self.shape["placeholder"], self.shape["box"], shape))
+            self.shape = None
+
+    def close_xfrm(self):
+        xfrm, self.xfrm = self.xfrm, None
+        if "off" not in xfrm or "ext" not in xfrm:
+            return
+        offset_x, offset_y, scale_x, scale_y = self.groups[-1]
+        x0 = offset_x + xfrm["off"][0] * scale_x
+        y0 = offset_y + xfrm["off"][1] * scale_y
+        x1 = x0 + xfrm["ext"][0] * scale_x
+        y1 = y0 + xfrm["ext"][1] * scale_y
+
+        if self.in_group_properties:
+            # Group transform: children positioned in chOff/chExt space are
+            # mapped onto the group's own off/ext box
+            child_offset = xfrm.get("chOff", xfrm["off"])
+            child_extent = xfrm.get("chExt", xfrm["ext"])
+            group_scale_x = (x1 - x0) / child_extent[0] if child_extent[0] else scale_x
+            group_scale_y = (y1 - y0) / child_extent[1] if child_extent[1] else scale_y
+            self.groups[-1] = (x0 - child_offset[0] * group_scale_x, y0 - child_offset[1] * group_scale_y,
+                               group_scale_x, group_scale_y)
+        elif self.shape is not None and self.shape["box"] is None:
+            self.shape["box"] = tuple(round(value / EMU_PER_POINT, 2) for value in (x0, y0, x1, y1))
+
+    def data(self, text):
+        if self.in_text:
+            self.shape["text"].append(text)
+
+    def drain(self):
+        return ()
+
+
+def slide_paths(archive):
+    # Slides in presentation order, the file names do not reflect it once
+    # slides have been moved around
+    presentation = ElementTree.fromstring(archive.read("ppt/presentation.xml"))
+    relationships = ElementTree.fromstring(archive.read("ppt/_rels/presentation.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in relationships.iter(PACKAGE_RELS + "Relationship")}
+
+    paths = []
+    for slide_id in presentation.iter("{%s}sldId" % P.strip()):
+        target = targets.get(slide_id.get("{%s}id" % R))
+        if target:
+            paths.append(posixpath.normpath(posixpath.join("ppt", target)))
+    return paths
+
+
+def related_part(archive, part_path, relationship_type):
+    directory, name = posixpath.split(part_path)
+    try:
+        relationships = ElementTree.fromstring(archive.read(posixpath.join(directory, "_rels", name + ".rels")))
+    except KeyError:
+        return None
+    for rel in relationships.iter(PACKAGE_RELS + "Relationship"):
+        if rel.get("Type") == relationship_type:
+            return posixpath.normpath(posixpath.join(directory, rel.get("Target")))
+    return None
+
+
+def parse_slide_part(archive, part_path):
+    handler = SlideHandler()
+    with archive.open(part_path) as stream:
+        for _ in iter_events(stream, handler):
+            pass
+    return handler
+
+
+def placeholder_boxes(handler):
+    # Boxes of a layout or master, by idx and by generic type
+    boxes = {}
+    for placeholder_type, idx, box, _ in handler.placeholders:
+        if box is not None:
+            if idx is not None:
+                boxes.setdefault(("idx", idx), box)
+            boxes.setdefault(("type", PLACEHOLDER_TYPES.get(placeholder_type, placeholder_type)), box)
+    return boxes
+
+
+def inherit_placeholders(handler, *inherited):
+    # Placeholders match by idx first and by type otherwise, the way
+    # PowerPoint resolves them, in the layout and then in the master
+    for placeholder_type, idx, box, shape in handler.placeholders:
+        if box is not None:
+            continue
+        for boxes in inherited:
+            box = boxes.get(("idx", idx)) or boxes.get(("type", PLACEHOLDER_TYPES.get(placeholder_type, placeholder_type)))
+            if box is not None:
+                break
+        if shape is not None:
+            shape["boxCoords"] = box
+    return handler
+
+
+def layout_boxes(archive, slide_path, cache):
+    # Placeholder boxes of the slide's layout and master, parsed once per
+    # archive since slides share a handful of layouts
+    layout_path = related_part(archive, slide_path, SLIDE_LAYOUT)
+    if layout_path is None:
+        return ()
+    if layout_path not in cache:
+        master_path = related_part(archive, layout_path, SLIDE_MASTER)
+        if master_path not in cache:
+            cache[master_path] = placeholder_boxes(parse_slide_part(archive, master_path)) if master_path else {}
+        layout = parse_slide_part(archive, layout_path)
+        cache[layout_path] = (placeholder_boxes(inherit_placeholders(layout, cache[master_path])), cache[master_path])
+    return cache[layout_path]
+
+
+def iter_pptx_slides(file_path):
+    # Yields, per slide, the list of shapes with their text and boxCoords, for
+    # the layout aware consumers
+    with zipfile.ZipFile(file_path) as archive:
+        layouts = {}
+        for slide_path in slide_paths(archive):
+            handler = parse_slide_part(archive, slide_path)
+            if any(box is None for _, _, box, _ in handler.placeholders):
+                inherit_placeholders(handler, *layout_boxes(archive, slide_path, layouts))
+            yield handler.shapes
+
+
+def reading_order(shape):
+    box = shape["boxCoords"]
+    return (box[1], box[0]) if box else (0, 0)
+
+
+def iter_pptx_text(file_path):
+    for shapes in iter_pptx_slides(file_path):
+        # sorted is stable, shapes without geometry (placeholders missing from
+        # the layout) keep their document order at the top of the slide
+        yield "".join(shape["text"] + "\n" for shape in sorted(shapes, key=reading_order))
@@ -0,0 +1,26 @@
+# Plain text files are read in fixed size blocks so a huge log or dump is
+# never held in memory as a whole. Blocks end on a line break when there is
+# one, a file without any (minified data, dumps) is cut at the block size
+TEXT_BLOCK_SIZE = 1 << 20
+
+
+def iter_plain_text(file_path, block_size=TEXT_BLOCK_SIZE):
+    with open(file_path, "r", encoding="utf-8", errors="replace", newline="") as text_file:
+        pending = ""
+        while True:
+            block = text_file.read(block_size)
+            if not block:
+                break
+            block = pending + block
+            # Cut at the last line break so lines are only split across blocks
+            # when they are longer than a block
+            cut = block.rfind("\n") + 1
+            if cut == 0:
+                if len(block) < block_size:
+                    pending = block
+                    continue
+                cut = len(block)
+            pending = block[cut:]
+            yield block[:cut]
+        if pending:
+            yield pending
@@ -1,6 +1,51 @@
-import OCRPipeline
-import TextPipeline
+from typing import Iterator, Optional, Sequence
+import Dispatcher
+import PostProcessing
+import Telemetry
 import os
 
-def extract_text(file_path: str) -> str:
-    pass
\ No newline at end of file
+# The packages above only import their modules when first used, so extracting
+# a txt file loads none of the OCR stack. The pdf and image pipelines live in
+# DocumentPipeline and are still reachable from here, extract_many is loaded
+# the same way, with the process pool
+__getattr__, __dir__ = Dispatcher.lazy_exports(__name__, {
+    "extract_many": "BatchExtractor.processPool",
+    **{name: "DocumentPipeline.cacheKeys" for name in ("cache_key", "PIPELINE_VERSION")},
+    **{name: "DocumentPipeline.pdfPipeline" for name in ("iter_pdf_file", "iter_pdf", "extract_page_batch")},
+    "iter_image": "DocumentPipeline.imagePipeline",
+})
+
+
+def iter_extract(file_path: str, pages: Optional[Sequence[int]] = None, cache=None) -> Iterator[str]:
+    # Yields the text of each page (or block, for formats without pages) as soon
+    # as it comes out of the pipeline, so callers never wait for the whole document.
+    # Only the OCR'd formats go through the cache, the rest is as cheap to extract
+    # again as it is to read back
+    with Telemetry.span('dispatch'):
+        file_type = Dispatcher.sniff_file_type(file_path)
+    if Telemetry.is_recording():
+        Telemetry.count('documents')
+        # Size of the whole file, whether every page is read or the text
+        # comes from the cache
+        Telemetry.count('document_bytes', os.path.getsize(file_path))
+
+    with Telemetry.span('document', path=file_path, file_type=file_type):
+        yield from _iter_file(file_path, file_type, pages, cache)
+
+
+def _iter_file(file_path, file_type, pages, cache):
+    # The handler of each format is in Dispatcher.registry
+    yield from Dispatcher.run_handler(file_type, file_path, pages=pages, cache=cache)
+
+
+def prewarm(file_types=None):
+    # Loads the handlers of file_types (every format by default) and opens the
+    # spelling index, so a process forked afterwards extracts its first file
+    # as fast as its hundredth
+    Dispatcher.prewarm(file_types)
+    if file_types is None or {'pdf', *Dispatcher.IMAGE_TYPES} & set(file_types):
+        PostProcessing.get_index()
+
+
+def extract_text(file_path: str, cache=None) -> str:
+    return "".join(iter_extract(file_path, cache=cache))